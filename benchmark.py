@@ -0,0 +1,832 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for run_analysis.py.
+
+Serves synthetic or recorded klines from a local stub of the Binance REST API so the fetch engine
+can be measured without touching api.binance.com.
+
+    python benchmark.py fetch --symbols 50 --latency 0.15 --workers 8
+    python benchmark.py signals --symbols 50
+    python benchmark.py indicators --candles 5000 --step 10
+    python benchmark.py stream --symbols 50 --candles 20
+    python benchmark.py analysis --symbols 50 --workers 1 2 4
+    python benchmark.py decode --rows 100000
+    python benchmark.py backtest --candles 1000000 --check-candles 20000
+    python benchmark.py resample --candles 40000
+    python benchmark.py batch --symbols 50 400 --candles 550
+
+The suite times every stage of a sweep at multiples of the live universe and writes JSON that can be
+compared across commits. Without --fixtures it generates deterministic trending, ranging and gappy
+series; `record` captures real /klines responses to replay instead.
+
+    python benchmark.py record --symbols BTCUSDT ETHUSDT --out fixtures
+    python benchmark.py suite --scales 1 10 100 --output before.json
+    python benchmark.py suite --fixtures fixtures --baseline before.json --output after.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import threading
+import sys
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import run_analysis
+
+INTERVAL_MS = run_analysis.INTERVAL_MS
+# Fixed end of the suite's synthetic series, so every run generates the same candles.
+SUITE_END_MS = 1_760_000_000_000
+SERIES_KINDS = ('trending', 'ranging', 'gappy')
+SUITE_VERSION = 1
+
+
+def synthetic_raw_klines(symbol: str, interval: str, end_ms: int, limit: int) -> List[List]:
+    """Deterministic Binance-shaped kline rows ending at end_ms (inclusive of its candle)."""
+    step = INTERVAL_MS[interval]
+    last_open = end_ms - end_ms % step
+    seed = sum(map(ord, symbol)) % 97 + 1
+    rows = []
+    for open_ms in range(last_open - (limit - 1) * step, last_open + 1, step):
+        i = open_ms // step
+        base = 100.0 + seed + ((i * 7919 + seed) % 400 - 200) / 100.0
+        close = base + ((i * 31 + seed) % 21 - 10) / 50.0
+        rows.append([open_ms, f"{base:.4f}", f"{max(base, close) + 0.25:.4f}", f"{min(base, close) - 0.25:.4f}",
+                     f"{close:.4f}", "1000.0", open_ms + step - 1, "0", 10, "0", "0", "0"])
+    return rows
+
+
+def synthetic_ohlcv(symbol: str, interval: str, num_candles: int, kind: str, end_ms: int = SUITE_END_MS
+                    ) -> np.ndarray:
+    """
+    Deterministic (n, 6) open_time/open/high/low/close/volume candles ending at end_ms, seeded by the key.
+
+    'trending' drifts up or down in regimes of a few hundred to a few thousand candles, 'ranging'
+    mean-reverts around its start price, and 'gappy' is a trend with ~3% of candles missing in runs
+    (as during exchange outages) and a price jump after each missing run.
+    """
+    rng = np.random.default_rng(zlib.crc32(f"{symbol}/{interval}/{kind}".encode()))
+    step = INTERVAL_MS[interval]
+    open_times = end_ms - end_ms % step - step * np.arange(num_candles - 1, -1, -1, dtype='int64')
+    start_price = float(np.exp(rng.uniform(np.log(0.01), np.log(50_000))))
+    if kind == 'ranging':
+        theta = 0.02
+        # An AR(1) process, x_t = (1 - theta) x_{t-1} + e_t, is an ewm with alpha=theta over e_t / theta.
+        log_prices = pd.Series(rng.normal(0.0, 0.004, num_candles) / theta).ewm(alpha=theta, adjust=False).mean()
+        log_prices = log_prices.to_numpy()
+    else:
+        regime_lengths = rng.integers(300, 3000, size=num_candles // 300 + 1)
+        drifts = np.repeat(rng.choice([-1.0, 1.0], size=len(regime_lengths)) * rng.uniform(1e-4, 6e-4,
+                           size=len(regime_lengths)), regime_lengths)[:num_candles]
+        log_prices = np.cumsum(drifts + rng.normal(0.0, 0.003, num_candles))
+    closes = start_price * np.exp(log_prices)
+    opens = np.r_[start_price, closes[:-1]]
+    keep = np.ones(num_candles, dtype=bool)
+    if kind == 'gappy':
+        for gap_start in rng.choice(num_candles - 20, size=max(1, num_candles // 400), replace=False):
+            gap_length = int(rng.integers(1, 20))
+            keep[gap_start:gap_start + gap_length] = False
+            jump = float(np.exp(rng.normal(0.0, 0.02)))
+            closes[gap_start + gap_length:] *= jump
+            opens[gap_start + gap_length + 1:] *= jump
+    wicks = np.abs(rng.normal(0.0, 0.002, (2, num_candles))) * closes
+    highs = np.maximum(opens, closes) + wicks[0]
+    lows = np.maximum(np.minimum(opens, closes) - wicks[1], np.minimum(opens, closes) * 0.5)
+    volumes = rng.lognormal(8.0, 1.0, num_candles)
+    return np.column_stack([open_times, opens, highs, lows, closes, volumes])[keep]
+
+
+def klines_rows(ohlcv: np.ndarray, interval: str) -> List[str]:
+    """Formats candles as /klines JSON rows, with Binance's 12 fields and string-quoted decimals."""
+    step = INTERVAL_MS[interval]
+    row = '[%d,"%.8f","%.8f","%.8f","%.8f","%.8f",%d,"0",%d,"0","0","0"]'
+    open_times = ohlcv[:, 0].astype('int64')
+    return [row % (t, o, h, l, c, v, t + step - 1, 100)
+            for t, o, h, l, c, v in zip(open_times.tolist(), *ohlcv[:, 1:].T.tolist())]
+
+
+def klines_body(ohlcv: np.ndarray, interval: str) -> bytes:
+    return ("[" + ",".join(klines_rows(ohlcv, interval)) + "]").encode()
+
+
+def load_fixtures(directory: str) -> Dict[Tuple[str, str], np.ndarray]:
+    """Reads <SYMBOL>_<interval>.json /klines bodies, as written by `record`, into candle arrays."""
+    fixtures = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'): continue
+        symbol, interval = filename[:-len('.json')].rsplit('_', 1)
+        with open(os.path.join(directory, filename), 'rb') as f:
+            fixtures[(symbol, interval)] = run_analysis.BinanceAPI._decode_klines(f.read())
+    return fixtures
+
+
+class StubBinanceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like api.binance.com.
+    latency = 0.0
+    now_ms = None  # Fixed clock for reproducible runs; None follows the wall clock.
+    fixtures = None  # {(symbol, interval): (open times, JSON rows)} to replay instead of synthetic klines.
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        time.sleep(self.latency)
+        if parsed.path.endswith('/klines') and self.fixtures is not None:
+            body = self._fixture_body(query)
+        elif parsed.path.endswith('/klines'):
+            limit = int(query.get('limit', 500))
+            now_ms = self.now_ms or int(time.time() * 1000)
+            end_ms = int(query.get('endTime', now_ms))
+            if 'startTime' in query:
+                step = INTERVAL_MS[query['interval']]
+                first_open = -(-int(query['startTime']) // step) * step
+                limit = max(0, min(limit, (now_ms - first_open) // step + 1))
+                end_ms = first_open + (limit - 1) * step
+            body = json.dumps(synthetic_raw_klines(query['symbol'], query['interval'], end_ms, limit)).encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fixture_body(self, query: Dict[str, str]) -> bytes:
+        """Slices a recorded series the way Binance pages: from startTime forwards, else back from endTime."""
+        fixture = self.fixtures.get((query['symbol'], query['interval']))
+        if fixture is None: return b"[]"
+        open_times, rows = fixture
+        limit = int(query.get('limit', 500))
+        end = int(np.searchsorted(open_times, int(query.get('endTime', 2 ** 62)), side='right'))
+        if 'startTime' in query:
+            start = int(np.searchsorted(open_times, int(query['startTime'])))
+            end = min(end, start + limit)
+        else:
+            start = max(0, end - limit)
+        return ("[" + ",".join(rows[start:end]) + "]").encode()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency: float, now_ms: int = None, fixtures: Optional[Dict[Tuple[str, str], np.ndarray]] = None
+                      ) -> Tuple[ThreadingHTTPServer, str]:
+    rendered = {key: (candles[:, 0], klines_rows(candles, key[1])) for key, candles in fixtures.items()} if fixtures else None
+    handler = type('StubHandler', (StubBinanceHandler,), {'latency': latency, 'now_ms': now_ms, 'fixtures': rendered})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+
+def bench_fetch(args) -> dict:
+    server, base_url = start_stub_server(args.latency)
+    run_analysis.BinanceAPI.BASE_URL = base_url
+    run_analysis.CANDLE_STORE = None  # Measure the network path, not the local candle cache.
+    symbols = [f"SYM{i:03d}USDT" for i in range(args.symbols)]
+    jobs = [(s, tf, run_analysis.ANALYSIS_CANDLE_COUNTS[tf] + run_analysis.MIN_CANDLES_FOR_INDICATORS)
+            for s in symbols for tf in run_analysis.TIMEFRAMES]
+    timings = {}
+    try:
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            results = run_analysis.fetch_klines_concurrently(jobs, max_workers=workers)
+            timings[workers] = time.perf_counter() - start
+            failed = sum(1 for df in results.values() if df is None or df.empty)
+            if failed:
+                logging.warning(f"{failed} stub fetches failed with {workers} workers.")
+    finally:
+        server.shutdown()
+    return {'benchmark': 'fetch', 'series': len(jobs), 'latency_s': args.latency,
+            'seconds_by_workers': timings, 'speedup': timings[1] / timings[args.workers],
+            'http': run_analysis.REQUEST_STATS.snapshot()}
+
+
+def synthetic_indicator_frames(num_series: int, num_candles: int, interval: str = '15m',
+                               end_ms: int = 1_760_000_000_000) -> List[Tuple[str, pd.DataFrame]]:
+    frames = []
+    for i in range(num_series):
+        symbol = f"SYM{i:03d}USDT"
+        raw = synthetic_raw_klines(symbol, interval, end_ms, num_candles + run_analysis.MIN_CANDLES_FOR_INDICATORS)
+        df = run_analysis.BinanceAPI._process_raw_klines_to_df(raw, symbol, interval)
+        frames.append((symbol, run_analysis.calculate_indicators(df).tail(num_candles).copy()))
+    return frames
+
+
+def bench_signals(args) -> dict:
+    """Times the per-row setup loop against scan_setups_for_series and checks they agree exactly."""
+    frames = synthetic_indicator_frames(args.symbols, args.candles)
+    timings, outputs = {}, {}
+    for name in ('per_row', 'array'):
+        start = time.perf_counter()
+        outputs[name] = []
+        for symbol, df in frames:
+            green_setup, red_setup = {'active': False}, {'active': False}
+            if name == 'per_row':
+                signals = []
+                for i in range(1, len(df)):
+                    signals.extend(run_analysis.check_and_update_setups_for_candle(symbol, '15m', df, i,
+                                                                                   green_setup, red_setup))
+            else:
+                # Split the scan to also exercise setups carried over between calls.
+                middle = len(df) // 2
+                signals = run_analysis.scan_setups_for_series(symbol, '15m', df.iloc[:middle], green_setup,
+                                                              red_setup)
+                signals += run_analysis.scan_setups_for_series(symbol, '15m', df, green_setup, red_setup,
+                                                               start_idx=middle)
+            outputs[name].append((signals, green_setup, red_setup))
+        timings[name] = time.perf_counter() - start
+    if outputs['per_row'] != outputs['array']:
+        raise AssertionError("scan_setups_for_series diverged from check_and_update_setups_for_candle")
+    num_signals = sum(len(signals) for signals, _, _ in outputs['array'])
+    return {'benchmark': 'signals', 'series': len(frames), 'candles': args.candles, 'signals': num_signals,
+            'seconds': timings, 'speedup': timings['per_row'] / timings['array']}
+
+
+def bench_indicators(args) -> dict:
+    """Times batch recomputation per step against IndicatorState.update_indicators and reports their drift."""
+    end_ms = 1_760_000_000_000
+    raw = synthetic_raw_klines('SYM000USDT', '15m', end_ms, args.candles)
+    df = run_analysis.BinanceAPI._process_raw_klines_to_df(raw, 'SYM000USDT', '15m')
+    window = run_analysis.ANALYSIS_CANDLE_COUNTS['15m'] + run_analysis.MIN_CANDLES_FOR_INDICATORS
+    seed = run_analysis.calculate_indicators(df.iloc[:window])
+    steps = range(window, len(df), args.step)
+
+    start = time.perf_counter()
+    for i in steps:
+        run_analysis.calculate_indicators(df.iloc[max(0, i + args.step - window): i + args.step])
+    batch_seconds = time.perf_counter() - start
+
+    state = run_analysis.IndicatorState.from_indicator_frame(seed, {'active': False}, {'active': False})
+    start = time.perf_counter()
+    streamed = pd.concat([state.update_indicators(df.iloc[i: i + args.step]) for i in steps])
+    streaming_seconds = time.perf_counter() - start
+
+    full = run_analysis.calculate_indicators(df).iloc[window:]
+    columns = [c for c in full.columns if c.startswith(('SMA_', 'EMA_'))]
+    max_abs_diff = float((streamed[columns] - full[columns]).abs().max().max())
+    states_equal = bool((streamed['market_state'] == full['market_state']).all())
+    if max_abs_diff > 1e-9 or not states_equal:
+        raise AssertionError(f"Streaming indicators diverged from batch (max diff {max_abs_diff}).")
+    return {'benchmark': 'indicators', 'candles': len(df) - window, 'step': args.step,
+            'seconds': {'batch': batch_seconds, 'streaming': streaming_seconds},
+            'speedup': batch_seconds / streaming_seconds, 'max_abs_diff': max_abs_diff}
+
+
+def bench_decode(args) -> dict:
+    """Rows/s and peak traced memory of kline decoding: json + DataFrame path vs the array decoder."""
+    raw = synthetic_raw_klines('SYM000USDT', '5m', 1_760_000_000_000, args.rows)
+    raw += raw[:args.rows // 100]  # Some overlap, as between paged chunks.
+    content = json.dumps(raw).encode()
+    api = run_analysis.BinanceAPI
+
+    def legacy():
+        return api._clean_historical_df(api._process_raw_klines_to_df(json.loads(content), 'SYM000USDT', '5m'))
+
+    def vectorized():
+        return api._klines_array_to_df(api._decode_klines(content))
+
+    results, frames = {}, {}
+    for name, decode in (('json_dataframe', legacy), ('array', vectorized)):
+        start = time.perf_counter()
+        frames[name] = decode()
+        seconds = time.perf_counter() - start
+        # Traced separately, as tracemalloc slows down allocation-heavy code a lot.
+        tracemalloc.start()
+        decode()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {'seconds': seconds, 'rows_per_s': len(raw) / seconds, 'peak_mib': peak / 2 ** 20}
+    pd.testing.assert_frame_equal(frames['json_dataframe'], frames['array'], check_index_type=False)
+    return {'benchmark': 'decode', 'rows': len(raw), 'body_mib': len(content) / 2 ** 20, 'results': results,
+            'speedup': results['json_dataframe']['seconds'] / results['array']['seconds']}
+
+
+def bench_analysis(args) -> dict:
+    """Scaling of the indicator + signal stage over worker processes; checks the merged signals agree."""
+    run_analysis.CANDLE_STORE = None  # Pure batch CPU work, no carried IndicatorState.
+    end_ms = 1_760_000_000_000
+    series = []
+    for i in range(args.symbols):
+        symbol = f"SYM{i:03d}USDT"
+        for timeframe in run_analysis.TIMEFRAMES:
+            count = run_analysis.ANALYSIS_CANDLE_COUNTS[timeframe]
+            raw = synthetic_raw_klines(symbol, timeframe, end_ms, count + run_analysis.MIN_CANDLES_FOR_INDICATORS)
+            series.append((symbol, timeframe, run_analysis.BinanceAPI._process_raw_klines_to_df(raw, symbol, timeframe),
+                           count))
+    timings, reference = {}, None
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = run_analysis.analyze_all_series(series, workers=workers)
+        timings[workers] = time.perf_counter() - start
+        if reference is None:
+            reference = results
+        elif results != reference:
+            raise AssertionError(f"Signals with {workers} workers differ from {args.workers[0]} worker(s).")
+    base = timings[args.workers[0]]
+    return {'benchmark': 'analysis', 'series': len(series), 'cpus': os.cpu_count(), 'seconds_by_workers': timings,
+            'speedup_by_workers': {workers: base / seconds for workers, seconds in timings.items()}}
+
+
+async def _replay_klines(symbols: List[str], timeframes: List[str], candles: int, now_ms: int):
+    """Starts a fake Binance stream server that sends `candles` closed klines per stream, in time order."""
+    import websockets
+
+    async def handler(ws):
+        messages = []
+        for symbol in symbols:
+            for timeframe in timeframes:
+                step = INTERVAL_MS[timeframe]
+                first_open = now_ms - now_ms % step
+                for row in synthetic_raw_klines(symbol, timeframe, first_open + (candles - 1) * step, candles):
+                    kline = {'t': row[0], 'T': row[6], 's': symbol, 'i': timeframe, 'o': row[1], 'h': row[2],
+                             'l': row[3], 'c': row[4], 'v': row[5], 'x': True}
+                    messages.append((row[0], json.dumps({'stream': f"{symbol.lower()}@kline_{timeframe}",
+                                                         'data': {'e': 'kline', 's': symbol, 'k': kline}})))
+        for _, message in sorted(messages, key=lambda m: m[0]):
+            await ws.send(message)
+        await ws.wait_closed()
+
+    return await websockets.serve(handler, '127.0.0.1', 0)
+
+
+def bench_stream(args) -> dict:
+    """Replays closed klines through SignalStream from a fake WebSocket server after a stub REST backfill."""
+    now_ms = int(time.time() * 1000)
+    server, base_url = start_stub_server(0.0, now_ms=now_ms)
+    run_analysis.BinanceAPI.BASE_URL = base_url
+    run_analysis.CANDLE_STORE = None
+    symbols = [f"SYM{i:03d}USDT" for i in range(args.symbols)]
+    timeframes = run_analysis.TIMEFRAMES
+    expected = len(symbols) * len(timeframes) * args.candles
+    cwd = os.getcwd()
+
+    async def run() -> Tuple[float, float, int]:
+        ws_server = await _replay_klines(symbols, timeframes, args.candles, now_ms)
+        ws_url = f"ws://127.0.0.1:{ws_server.sockets[0].getsockname()[1]}"
+        stream = run_analysis.SignalStream(symbols, timeframes, ws_url=ws_url)
+        processed, done = 0, asyncio.Event()
+        on_kline = stream.on_kline
+        timings = {}
+
+        async def counting_on_kline(kline):
+            nonlocal processed
+            if processed == 0:
+                timings['first'] = time.perf_counter()
+            await on_kline(kline)
+            processed += 1
+            if processed == expected: done.set()
+
+        stream.on_kline = counting_on_kline
+        start = time.perf_counter()
+        task = asyncio.create_task(stream.run())
+        await asyncio.wait_for(done.wait(), timeout=600)
+        end = time.perf_counter()
+        task.cancel()
+        ws_server.close()
+        num_signals = sum(len(run_analysis.SIGNAL_STORE.sections(tf)) for tf in timeframes)
+        return timings['first'] - start, end - timings['first'], num_signals
+
+    with tempfile.TemporaryDirectory() as report_dir:
+        os.chdir(report_dir)  # SignalStream writes reports to the working directory.
+        run_analysis.SIGNAL_STORE = run_analysis.SignalStore(os.path.join(report_dir, 'signals.sqlite3'))
+        try:
+            backfill_seconds, stream_seconds, num_signals = asyncio.run(run())
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+    return {'benchmark': 'stream', 'series': len(symbols) * len(timeframes), 'closed_klines': expected,
+            'signals': num_signals, 'backfill_seconds': backfill_seconds, 'stream_seconds': stream_seconds,
+            'ms_per_kline': 1000 * stream_seconds / expected}
+
+
+def random_walk_frame(num_candles: int, interval: str = '1m', seed: int = 7) -> pd.DataFrame:
+    """A closed random-walk OHLCV series ending one interval before now."""
+    rng = np.random.default_rng(seed)
+    step = INTERVAL_MS[interval]
+    now_ms = int(time.time() * 1000)
+    last_open = now_ms - now_ms % step - step
+    open_times = last_open - step * np.arange(num_candles - 1, -1, -1, dtype='int64')
+    closes = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.002, num_candles)))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    wicks = np.abs(rng.normal(0.0, 0.001, (2, num_candles))) * closes
+    index = pd.to_datetime(open_times, unit='ms', utc=True).rename('open_time')
+    return pd.DataFrame({'open': opens, 'high': np.maximum(opens, closes) + wicks[0],
+                         'low': np.minimum(opens, closes) - wicks[1], 'close': closes,
+                         'volume': np.full(num_candles, 1000.0)}, index=index)
+
+
+def check_outcome_fixture() -> int:
+    """
+    Runs SignalOutcomeTracker over ten hand-built 1h candles, split in two chunks after candle 5, and
+    checks every outcome field against values worked out by hand. Returns the number of trades checked.
+
+    A Short at 1 is stopped on 4; a Long at 2 expires after max_hold_candles=4 across the chunk
+    boundary (the 120 high on 7 is past expiry); a Short at 4 spans the boundary and is stopped on 7
+    (its 80 low on the stop candle is not counted); a Long at 8 is still open at the end.
+    """
+    highs = [100, 100, 101, 102, 106, 104, 108, 120, 100, 103]
+    lows = [100, 100, 97, 95, 91, 96, 93, 80, 100, 99]
+    index = pd.date_range('2024-01-01', periods=len(highs), freq='h', tz='UTC', name='open_time')
+    df = pd.DataFrame({'open': 100.0, 'high': highs, 'low': lows, 'close': 100.0, 'volume': 1.0}, index=index,
+                      dtype='float64')
+
+    def signal(kind: str, alert: int, stoploss: float) -> dict:
+        return {'symbol': 'FIXTUREUSDT', 'timeframe': '1h', 'type': kind, 'alert_time': index[alert],
+                'alert_candle_close': 100.0, 'json_stoploss_val': stoploss}
+
+    tracker = run_analysis.SignalOutcomeTracker(max_hold_candles=4)
+    tracker.add([signal('Green', 1, 105.0), signal('Red', 2, 90.0), signal('Green', 4, 110.0)])
+    tracker.update(df.iloc[:6])
+    tracker.add([signal('Red', 8, 50.0)])
+    tracker.update(df.iloc[6:])
+    outcomes = tracker.finish()
+
+    expected = [  # (direction, outcome, candles_held, mfe, mfe_r, hours_to_resolution), in resolution order
+        ('Short', 'stopped', 3, 5.0, 5.0 / 5.0, 3.0),
+        ('Long', 'expired', 4, 8.0, 8.0 / 10.0, 4.0),
+        ('Short', 'stopped', 3, 7.0, 7.0 / 10.0, 3.0),
+        ('Long', 'open', 1, 3.0, 3.0 / 50.0, None),
+    ]
+    actual = [(o['direction'], o['outcome'], o['candles_held'], o['mfe'], o['mfe_r'], o['hours_to_resolution'])
+              for o in outcomes]
+    if actual != expected:
+        raise AssertionError(f"outcome fixture mismatch: {actual} != {expected}")
+    summary = run_analysis.summarize_outcomes(outcomes)
+    expected_summary = {'signals': 4, 'stopped': 2, 'expired': 1, 'open': 1, 'stop_rate': 0.5,
+                        'mean_mfe_r': float(np.mean([o[4] for o in expected])),
+                        'median_mfe_r': (0.7 + 0.8) / 2, 'median_candles_to_stop': 3.0}
+    if summary != expected_summary:
+        raise AssertionError(f"outcome summary mismatch: {summary} != {expected_summary}")
+    return len(outcomes)
+
+
+def check_history_backfill(tmp: str) -> int:
+    """
+    Syncs 2 days of 1h history from the stub, then 30 days, and checks the store then holds every candle
+    of the 30 days: the second sync must backfill before the first stored candle, not only top up after
+    the last. Returns the number of candles checked.
+    """
+    symbol, interval, step = 'SYNTHUSDT', '1h', INTERVAL_MS['1h']
+    server, base_url = start_stub_server(0.0, now_ms=SUITE_END_MS)
+    api_url, run_analysis.BinanceAPI.BASE_URL = run_analysis.BinanceAPI.BASE_URL, base_url
+    try:
+        store = run_analysis.CandleStore(os.path.join(tmp, 'backfill.sqlite3'))
+        for days in (2, 30):
+            run_analysis.sync_candle_history(store, symbol, interval, SUITE_END_MS - days * 86_400_000)
+    finally:
+        run_analysis.BinanceAPI.BASE_URL = api_url
+        server.shutdown()
+    first_open = -(-(SUITE_END_MS - 30 * 86_400_000) // step) * step
+    expected = np.arange(first_open, SUITE_END_MS - SUITE_END_MS % step + 1, step)
+    stored = np.concatenate([df.index.as_unit('ms').asi8 for df in store.iter_chunks(symbol, interval, 10_000)])
+    if not np.array_equal(stored, expected):
+        raise AssertionError(f"history backfill stored {len(stored)} candles, expected {len(expected)}")
+    return len(stored)
+
+
+def bench_backtest(args) -> dict:
+    """
+    Backtests a long synthetic series from a temporary history store in bounded chunks, and checks on
+    a shorter series that chunking finds exactly the signals of one full-history scan. The outcome
+    statistics are checked first on a hand-built fixture (check_outcome_fixture), and history syncing
+    on the stub (check_history_backfill).
+    """
+    checked_outcomes = check_outcome_fixture()
+    symbol, interval = 'SYNTHUSDT', '1m'
+    with tempfile.TemporaryDirectory() as tmp:
+        checked_history = check_history_backfill(tmp)
+        store = run_analysis.CandleStore(os.path.join(tmp, 'history.sqlite3'))
+        check_df = random_walk_frame(args.check_candles, interval)
+        store.save(symbol, interval, check_df, keep=None)
+        outcomes, _ = run_analysis.backtest_series(store, symbol, interval, chunk_size=args.check_candles // 7)
+        df_full = run_analysis.calculate_indicators(check_df)
+        expected = run_analysis.scan_setups_for_series(symbol, interval, df_full, {'active': False},
+                                                       {'active': False})
+        chunked = [(o['type'], o['alert_time']) for o in outcomes]
+        full = [(s['type'], s['alert_time'].strftime(run_analysis.REPORT_DATE_FORMAT)) for s in expected]
+        if sorted(chunked) != sorted(full):
+            raise AssertionError("chunked backtest signals diverged from a full-history scan")
+
+        store = run_analysis.CandleStore(os.path.join(tmp, 'long.sqlite3'))
+        start = time.perf_counter()
+        store.save(symbol, interval, random_walk_frame(args.candles, interval, seed=11), keep=None)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        outcomes, num_candles = run_analysis.backtest_series(store, symbol, interval, chunk_size=args.chunk)
+        seconds = time.perf_counter() - start
+    summary = run_analysis.summarize_outcomes(outcomes)
+    return {'benchmark': 'backtest', 'candles': num_candles, 'chunk': args.chunk, 'store_seconds': load_seconds,
+            'seconds': seconds, 'candles_per_second': num_candles / seconds, 'checked_signals': len(full),
+            'checked_outcomes': checked_outcomes, 'checked_history_candles': checked_history, 'summary': summary}
+
+
+def bench_resample(args) -> dict:
+    """
+    Resamples a gappy 5m series to every derived timeframe, checks candles and indicators against an
+    independent pandas resample, and counts fetch jobs against one fetch per timeframe.
+    """
+    base = random_walk_frame(args.candles, run_analysis.BASE_INTERVAL)
+    # A single missing 5m candle, as when a pair had no trades in that window.
+    base = base.drop(base.index[len(base) // 2])
+    timings, max_diff = {}, 0.0
+    for interval in run_analysis.DERIVED_TIMEFRAMES:
+        start = time.perf_counter()
+        derived = run_analysis.resample_klines(base, interval)
+        timings[interval] = time.perf_counter() - start
+        expected = base.resample(pd.Timedelta(milliseconds=INTERVAL_MS[interval]), origin='epoch').agg(
+            {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna()
+        expected = expected[expected.index >= base.index[0]]
+        pd.testing.assert_frame_equal(derived, expected, check_freq=False, check_names=False)
+        derived_ind = run_analysis.calculate_indicators(derived)
+        expected_ind = run_analysis.calculate_indicators(expected)
+        columns = [c for c in derived_ind.columns if c.startswith(('SMA_', 'EMA_'))]
+        max_diff = max(max_diff, float((derived_ind[columns] - expected_ind[columns]).abs().max().max()))
+        if not derived_ind['market_state'].equals(expected_ind['market_state']):
+            raise AssertionError(f"market states on resampled {interval} candles diverged")
+    if max_diff > 1e-9:
+        raise AssertionError(f"indicators on resampled candles diverged (max diff {max_diff})")
+    jobs, _ = run_analysis.plan_fetch_jobs(['SYNTHUSDT'], run_analysis.TIMEFRAMES)
+    return {'benchmark': 'resample', 'base_candles': len(base), 'seconds': timings,
+            'max_indicator_diff': max_diff, 'fetch_jobs_per_symbol': len(jobs),
+            'fetch_jobs_per_symbol_without_resampling': len(run_analysis.TIMEFRAMES),
+            'base_candles_per_symbol': dict((tf, n) for _, tf, n in jobs)}
+
+
+def bench_batch(args) -> dict:
+    """
+    Per-symbol calculate_indicators against the (time x symbol) matrix pass, at several universe sizes.
+    Some series are shorter, gappy or missing their last candles; results must be identical.
+    """
+    results = {}
+    for num_symbols in args.symbols:
+        frames = {}
+        for i in range(num_symbols):
+            df = random_walk_frame(args.candles - (i % 7) * 10, '15m', seed=i)
+            if i % 3 == 0:
+                df = df.drop(df.index[100:103])
+            if i % 5 == 0:
+                df = df.iloc[:-2]
+            frames[f"SYM{i:03d}USDT"] = df
+        start = time.perf_counter()
+        expected = {symbol: run_analysis.calculate_indicators(df) for symbol, df in frames.items()}
+        per_symbol_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        batched = run_analysis.calculate_indicators_batch(frames)
+        batch_seconds = time.perf_counter() - start
+        for symbol in frames:
+            pd.testing.assert_frame_equal(expected[symbol], batched[symbol], check_exact=True)
+        closes = pd.concat({s: df['close'] for s, df in frames.items()}, axis=1, sort=True).to_numpy()
+        start = time.perf_counter()
+        run_analysis.calculate_indicator_matrix(closes)
+        matrix_seconds = time.perf_counter() - start
+        results[num_symbols] = {'per_symbol_seconds': per_symbol_seconds, 'batch_seconds': batch_seconds,
+                                'matrix_only_seconds': matrix_seconds,
+                                'speedup': per_symbol_seconds / batch_seconds,
+                                'matrix_speedup': per_symbol_seconds / matrix_seconds}
+    return {'benchmark': 'batch', 'candles': args.candles, 'by_symbols': results}
+
+
+def record_fixtures(args) -> dict:
+    """Saves the /klines responses a sweep of `symbols` would fetch from api.binance.com as replayable fixtures."""
+    os.makedirs(args.out, exist_ok=True)
+    jobs, _ = run_analysis.plan_fetch_jobs(args.symbols, run_analysis.TIMEFRAMES)
+    recorded = {}
+    for symbol, interval, num_candles in jobs:
+        pages, end_ms = [], None
+        while sum(len(page) for page in pages) < num_candles:
+            params = {'symbol': symbol, 'interval': interval, 'limit': run_analysis.HISTORICAL_DATA_CHUNK_LIMIT}
+            if end_ms is not None:
+                params['endTime'] = end_ms
+            page = run_analysis.BinanceAPI._request_klines(params)
+            if page is None or len(page) == 0: break
+            pages.insert(0, page)
+            end_ms = int(page[0, 0]) - 1
+        candles = run_analysis.BinanceAPI._klines_array_to_df(np.concatenate(pages)) if pages else None
+        if candles is None: continue
+        array = np.column_stack([candles.index.as_unit('ns').asi8 // 1_000_000, candles.to_numpy()])
+        with open(os.path.join(args.out, f"{symbol}_{interval}.json"), 'wb') as f:
+            f.write(klines_body(array, interval))
+        recorded[f"{symbol}/{interval}"] = len(array)
+    return {'benchmark': 'record', 'out': args.out, 'candles': recorded}
+
+
+def _suite_fixtures(symbols: List[str]) -> Dict[Tuple[str, str], np.ndarray]:
+    """Synthetic candles for every job of a sweep, cycling through SERIES_KINDS by symbol."""
+    jobs, _ = run_analysis.plan_fetch_jobs(symbols, run_analysis.TIMEFRAMES)
+    kinds = {symbol: SERIES_KINDS[i % len(SERIES_KINDS)] for i, symbol in enumerate(symbols)}
+    return {(symbol, interval): synthetic_ohlcv(symbol, interval, num_candles, kinds[symbol])
+            for symbol, interval, num_candles in jobs}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(args) -> dict:
+    """
+    Times each stage of a sweep at `scales` times the universe, on synthetic or recorded candles.
+    On one core the default 1/10/100 takes about ten minutes, mostly parsing; --stages narrows it.
+
+    fetch_replay runs fetch_klines_concurrently against the stub once, at 1x. The CPU stages reuse
+    the 1x responses and series for every replica; the report stages rename the 1x signals per
+    replica, so the report grows with the scale as it would with a bigger universe.
+    """
+    api = run_analysis.BinanceAPI
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+        symbols = sorted({symbol for symbol, _ in fixtures})
+    else:
+        symbols = [f"SYM{i:03d}USDT" for i in range(args.symbols)]
+        fixtures = _suite_fixtures(symbols)
+    timeframes = run_analysis.TIMEFRAMES
+    jobs, needed_candles = run_analysis.plan_fetch_jobs(symbols, timeframes)
+    results: Dict[str, Dict] = {}
+
+    def timed(stage: str, scale: int, func, items: int, rows: int = 0):
+        if args.stages and stage not in args.stages: return None
+        print(f"suite: {stage} at {scale}x...", file=sys.stderr, flush=True)
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        results.setdefault(stage, {})[str(scale)] = {'seconds': seconds, 'items': items, 'rows': rows,
+                                                     'items_per_second': items / seconds if seconds > 0 else None}
+
+    body_rows = sum(len(candles) for candles in fixtures.values())
+
+    # Fetch through the stub: paging, HTTP, decoding and cleaning together. The frames are also built
+    # directly, so the later stages have their input when fetch_replay is not selected.
+    fetched = {(symbol, interval): api._klines_array_to_df(candles) for (symbol, interval), candles in fixtures.items()}
+    now_ms = int(max(candles[-1, 0] for candles in fixtures.values())) + 1
+    server, base_url = start_stub_server(0.0, now_ms=now_ms, fixtures=fixtures)
+    api.BASE_URL, candle_store = base_url, run_analysis.CANDLE_STORE
+    run_analysis.CANDLE_STORE = None
+    try:
+        timed('fetch_replay', 1, lambda: fetched.update(run_analysis.fetch_klines_concurrently(jobs)), len(jobs),
+              body_rows)
+    finally:
+        server.shutdown()
+        run_analysis.CANDLE_STORE = candle_store
+    series, _ = run_analysis.assemble_series(symbols, timeframes, fetched, needed_candles)
+    if not series:
+        raise RuntimeError("no series could be assembled from the fixtures")
+    bodies = [klines_body(candles[i:i + run_analysis.HISTORICAL_DATA_CHUNK_LIMIT], interval)
+              for (_, interval), candles in fixtures.items()
+              for i in range(0, len(candles), run_analysis.HISTORICAL_DATA_CHUNK_LIMIT)]
+    frames_by_tf: Dict[str, Dict[str, pd.DataFrame]] = {}
+    for symbol, timeframe, df_raw, _ in series:
+        frames_by_tf.setdefault(timeframe, {})[symbol] = df_raw
+    indicator_frames = [(symbol, timeframe, run_analysis.calculate_indicators(df_raw).tail(count))
+                        for symbol, timeframe, df_raw, count in series]
+    series_rows = sum(len(df_raw) for _, _, df_raw, _ in series)
+
+    def scan_all():
+        signals = []
+        for symbol, timeframe, df in indicator_frames:
+            signals += run_analysis.scan_setups_for_series(symbol, timeframe, df, {'active': False},
+                                                           {'active': False})
+        return signals
+
+    base_signals = scan_all()
+
+    # The stage loops drop each result straight away, so memory stays flat at 100x.
+    def parse(scale: int):
+        for _ in range(scale):
+            for body in bodies:
+                api._klines_array_to_df(api._decode_klines(body))
+
+    def indicators(scale: int):
+        for _ in range(scale):
+            for _, _, df_raw, _ in series:
+                run_analysis.calculate_indicators(df_raw)
+
+    def indicators_batch(scale: int):
+        for frames in frames_by_tf.values():
+            run_analysis.calculate_indicators_batch({f"R{r}{symbol}": df for r in range(scale)
+                                                     for symbol, df in frames.items()})
+
+    def signals_loop(scale: int):
+        for _ in range(scale):
+            scan_all()
+
+    for scale in args.scales:
+        timed('parse', scale, lambda: parse(scale), len(bodies) * scale, body_rows * scale)
+        timed('indicators', scale, lambda: indicators(scale), len(series) * scale,
+               series_rows * scale)
+        timed('indicators_batch', scale, lambda: indicators_batch(scale),
+               len(series) * scale, series_rows * scale)
+        timed('signals', scale, lambda: signals_loop(scale), len(series) * scale,
+               sum(len(df) for _, _, df in indicator_frames) * scale)
+
+        signals = [dict(signal, symbol=f"R{r}{signal['symbol']}") for r in range(scale) for signal in base_signals]
+        by_tf = {tf: [signal for signal in signals if signal['timeframe'] == tf] for tf in timeframes}
+        cwd = os.getcwd()
+        signal_store = run_analysis.SIGNAL_STORE
+        with tempfile.TemporaryDirectory() as report_dir:
+            os.chdir(report_dir)  # Reports are read from and written to the working directory.
+            try:
+                timed('report_write', scale,
+                       lambda: [run_analysis.generate_timeframe_json_report(by_tf[tf], f"{run_analysis.JSON_FILENAME_PREFIX}_{tf}.json")
+                                for tf in timeframes], len(signals))
+                # The first load rebuilds and saves the signal index; the second reads it without parsing reports.
+                timed('report_load', scale, run_analysis.load_existing_signals, len(signals))
+                timed('report_load_indexed', scale, run_analysis.load_existing_signals, len(signals))
+                for tf in timeframes:
+                    if os.path.exists(f"{run_analysis.JSON_FILENAME_PREFIX}_{tf}.json"):
+                        os.remove(f"{run_analysis.JSON_FILENAME_PREFIX}_{tf}.json")
+                run_analysis.SIGNAL_STORE = run_analysis.SignalStore(os.path.join(report_dir, 'signals.sqlite3'))
+
+                def store_and_export():
+                    run_analysis.SIGNAL_STORE.add_signals(signals)
+                    for tf in timeframes:
+                        run_analysis.export_timeframe_report(tf)
+
+                timed('report_store', scale, store_and_export, len(signals))
+            finally:
+                run_analysis.SIGNAL_STORE = signal_store
+                os.chdir(cwd)
+
+    report = {'suite_version': SUITE_VERSION, 'commit': _git_commit(),
+              'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                              'pandas': pd.__version__, 'cpus': os.cpu_count()},
+              'data': args.fixtures or 'synthetic', 'symbols': len(symbols), 'timeframes': timeframes,
+              'series': len(series), 'signals_at_1x': len(base_signals), 'scales': args.scales, 'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        # > 1 means this run was faster than the baseline.
+        report['speedup_vs_baseline'] = {
+            stage: {scale: baseline[stage][scale]['seconds'] / timing['seconds']
+                    for scale, timing in timings.items() if scale in baseline.get(stage, {})}
+            for stage, timings in results.items()}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    fetch = sub.add_parser('fetch', help='Concurrent kline fetching against a local stub server.')
+    fetch.add_argument('--symbols', type=int, default=10)
+    fetch.add_argument('--latency', type=float, default=0.1, help='Simulated per-request latency in seconds.')
+    fetch.add_argument('--workers', type=int, default=run_analysis.MAX_FETCH_WORKERS)
+    signals = sub.add_parser('signals', help='Setup state machine: per-row loop vs array engine.')
+    signals.add_argument('--symbols', type=int, default=50)
+    signals.add_argument('--candles', type=int, default=500)
+    indicators = sub.add_parser('indicators', help='Batch indicator recomputation vs streaming IndicatorState.')
+    indicators.add_argument('--candles', type=int, default=5000)
+    indicators.add_argument('--step', type=int, default=10, help='New candles per simulated run.')
+    stream = sub.add_parser('stream', help='SignalStream against a fake kline WebSocket server.')
+    stream.add_argument('--symbols', type=int, default=10)
+    stream.add_argument('--candles', type=int, default=20, help='Closed klines replayed per stream.')
+    analysis = sub.add_parser('analysis', help='Indicator + signal stage scaling over worker processes.')
+    analysis.add_argument('--symbols', type=int, default=50)
+    analysis.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    decode = sub.add_parser('decode', help='Kline response decoding throughput and peak memory.')
+    decode.add_argument('--rows', type=int, default=100_000)
+    backtest = sub.add_parser('backtest', help='Chunked backtest over a long series from a history store.')
+    backtest.add_argument('--candles', type=int, default=1_000_000)
+    backtest.add_argument('--chunk', type=int, default=run_analysis.BACKTEST_CHUNK_CANDLES)
+    backtest.add_argument('--check-candles', type=int, default=20_000)
+    resample = sub.add_parser('resample', help='Deriving higher timeframes from the base interval.')
+    resample.add_argument('--candles', type=int, default=40_000)
+    batch = sub.add_parser('batch', help='Per-symbol indicators vs one cross-symbol matrix pass.')
+    batch.add_argument('--symbols', type=int, nargs='+', default=[50, 400])
+    batch.add_argument('--candles', type=int, default=550)
+    record = sub.add_parser('record', help='Record live /klines responses as fixtures for the suite.')
+    record.add_argument('--symbols', nargs='+', required=True)
+    record.add_argument('--out', default='fixtures')
+    suite = sub.add_parser('suite', help='Every sweep stage at multiples of the universe, as comparable JSON.')
+    suite.add_argument('--symbols', type=int, default=50, help='Synthetic universe size (ignored with --fixtures).')
+    suite.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    suite.add_argument('--fixtures', help='Directory of recorded fixtures to replay instead of synthetic data.')
+    suite.add_argument('--stages', nargs='+', help='Only run these stages (e.g. parse indicators signals).')
+    suite.add_argument('--baseline', help='Suite JSON of an earlier commit to compare against.')
+    suite.add_argument('--output', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = {'fetch': bench_fetch, 'signals': bench_signals, 'indicators': bench_indicators, 'stream': bench_stream, 'analysis': bench_analysis, 'decode': bench_decode,
+              'backtest': bench_backtest, 'resample': bench_resample,
+              'batch': bench_batch, 'record': record_fixtures, 'suite': bench_suite}[args.command](args)
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,35 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 import pandas as pd
 import requests
+import requests.adapters
 from datetime import datetime
 import time
 import os
 import logging
 import sys
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import json
 import math
+import random
+import warnings
+import calendar
+import heapq
+import copy
+import argparse
+import asyncio
+import threading
+import sqlite3
+import subprocess
+import cProfile
+import pstats
+import tracemalloc
+import functools
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from urllib.parse import urlparse
 
 # --- Configuration for Historical Analysis ---
 SYMBOLS: List[str] = []
@@ -26,11 +47,64 @@ DEFAULT_ANALYSIS_CANDLE_COUNT = 2000
 
 TIMEFRAMES = ['5m', '15m', '30m', '1h', '2h', '4h', '1d']
 
+# Batch sweeps fetch only BASE_INTERVAL (plus the timeframes below not listed here) and resample these
+# from it locally. Binance buckets intraday klines from the Unix epoch in UTC, so floor(open_time / step)
+# reproduces its boundaries. 1d stays fetched for depth: it would need 288 base candles per day.
+BASE_INTERVAL = '5m'
+DERIVED_TIMEFRAMES = ['15m', '30m', '1h', '2h', '4h']
+
+INTERVAL_MS: Dict[str, int] = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000, '8h': 28_800_000,
+    '12h': 43_200_000, '1d': 86_400_000, '3d': 259_200_000, '1w': 604_800_000
+}
+
 # Data fetching settings
 HISTORICAL_DATA_CHUNK_LIMIT = 1000
+KLINE_FIELD_COUNT = 12
+# DataFrame.attrs key holding when a series was fetched (ms); candles closed before it are final.
+FETCHED_AT_ATTR = 'fetched_at_ms'
 API_RETRY_ATTEMPTS = 3
 API_RETRY_DELAY = 5
 REQUEST_TIMEOUT = 20
+# Pooled keep-alive connections shared by all requests; sized for the fetch thread pool.
+HTTP_POOL_SIZE = 16
+# Longest Retry-After (seconds) we wait out on 429/418 before giving up on a request.
+MAX_RETRY_AFTER_WAIT = 120
+
+# Concurrent fetching settings. Binance allows 6000 request weight per minute per IP;
+# we keep a margin so other tools sharing the IP are not starved.
+MAX_FETCH_WORKERS = 8
+
+# Worker processes for the indicator + signal stage (--workers). 1 keeps it in the main process.
+ANALYSIS_WORKERS = 1
+SHARED_CANDLE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+REQUEST_WEIGHT_BUDGET_PER_MINUTE = 4800
+KLINES_REQUEST_WEIGHT = 2
+TICKER_24HR_ALL_REQUEST_WEIGHT = 80
+
+# Local candle cache, so each run only downloads candles closed since the previous run.
+# Set CANDLE_STORE to None to always fetch the full window from the API.
+CANDLE_CACHE_FILENAME = "candle_cache.sqlite3"
+
+# Backtest settings (--backtest). History lives in its own store, which is never trimmed.
+CANDLE_HISTORY_FILENAME = "candle_history.sqlite3"
+BACKTEST_CHUNK_CANDLES = 100_000
+# A signal whose stop is not hit within this many candles is closed as 'expired'.
+BACKTEST_MAX_HOLD_CANDLES = 500
+BACKTEST_REPORT_FILENAME = "backtest_report.json"
+
+# Scheduler settings (--daemon): wake this long after each candle close so Binance has the closed
+# kline, and retry series that were not served yet up to SCHEDULER_MAX_RETRIES times.
+SCHEDULER_CLOSE_DELAY_SECONDS = 3
+SCHEDULER_RETRY_SECONDS = 15
+SCHEDULER_MAX_RETRIES = 3
+TOP_SYMBOLS_LIMIT = 50
+
+# Live streaming settings (--stream). Binance allows up to 1024 streams per connection.
+BINANCE_WS_URL = "wss://stream.binance.com:9443/stream"
+STREAMS_PER_CONNECTION = 200
+WS_RECONNECT_DELAY = 5
 
 # Strategy Indicator Settings
 EMA_SHORT_PERIOD = 13
@@ -41,6 +115,20 @@ MIN_CANDLES_FOR_INDICATORS = max(EMA_LONG_PERIOD, SMA_LONG_PERIOD)
 
 # --- Output File Configuration ---
 JSON_FILENAME_PREFIX = "signals_report"
+# Append-only signal log; the JSON reports are exported from it. Set SIGNAL_STORE to None to
+# dedup against the JSON reports themselves.
+SIGNAL_DB_FILENAME = "signals.sqlite3"
+# Only export signals from the last N days to the JSON reports (None exports the full history).
+REPORT_WINDOW_DAYS: Optional[int] = None
+# Without the signal store, report dedup ids are kept in this packed index next to the reports.
+SIGNAL_INDEX_FILENAME = f"{JSON_FILENAME_PREFIX}_index.npz"
+# Per-stage timings of each run, as JSON and in the Prometheus text exposition format.
+RUN_SUMMARY_FILENAME = "run_summary.json"
+RUN_METRICS_FILENAME = "run_summary.prom"
+METRICS_PREFIX = "signal_scanner"
+# --profile output: cProfile stats (load with pstats) and how many entries to log/keep.
+PROFILE_STATS_FILENAME = "run_profile.pstats"
+PROFILE_TOP_ENTRIES = 25
 
 _temp_map_tf_for_gui_slots = {
     "1m": "1min", "3m": "3min", "5m": "5min", "15m": "15min", "30m": "30min",
@@ -61,16 +149,393 @@ logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
 # --- Helper Functions ---
+class StageStats:
+    """
+    Thread-safe wall time, calls, rows and bytes per pipeline stage, overall and per (symbol, timeframe).
+
+    Stages nest: a stage opened without a symbol inherits the series of the enclosing stage on the same
+    thread, and its time is also included in the enclosing stage's time. Bytes and rows reported
+    with add() go to the innermost open stage.
+    """
+
+    FIELDS = ('calls', 'seconds', 'rows', 'bytes')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._series: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    def _record(self, totals: Dict[str, float], calls: int, seconds: float, rows: int, num_bytes: int):
+        totals['calls'] += calls
+        totals['seconds'] += seconds
+        totals['rows'] += rows
+        totals['bytes'] += num_bytes
+
+    def record(self, name: str, seconds: float = 0.0, rows: int = 0, num_bytes: int = 0, calls: int = 1,
+               series: Optional[str] = None):
+        with self._lock:
+            self._record(self._stages.setdefault(name, dict.fromkeys(self.FIELDS, 0)), calls, seconds, rows,
+                         num_bytes)
+            if series is not None:
+                self._record(self._series.setdefault(series, {}).setdefault(name, dict.fromkeys(self.FIELDS, 0)),
+                             calls, seconds, rows, num_bytes)
+
+    @contextmanager
+    def stage(self, name: str, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        stack = self._local.__dict__.setdefault('stack', [])
+        series = f"{symbol}/{timeframe}" if symbol else (stack[-1]['series'] if stack else None)
+        frame = {'series': series, 'rows': 0, 'bytes': 0}
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            stack.pop()
+            self.record(name, time.perf_counter() - start, frame['rows'], frame['bytes'], series=series)
+
+    def add(self, rows: int = 0, num_bytes: int = 0):
+        stack = self._local.__dict__.get('stack')
+        if stack:
+            stack[-1]['rows'] += rows
+            stack[-1]['bytes'] += num_bytes
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'stages': {name: dict(totals) for name, totals in self._stages.items()},
+                    'series': {series: {name: dict(totals) for name, totals in stages.items()}
+                               for series, stages in self._series.items()}}
+
+    def drain(self) -> Dict:
+        """Returns the snapshot and starts counting from zero (used to ship worker stats to the parent)."""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stages, self._series = {}, {}
+
+    def merge(self, snapshot: Dict):
+        for name, totals in snapshot['stages'].items():
+            self.record(name, totals['seconds'], totals['rows'], totals['bytes'], calls=totals['calls'])
+        with self._lock:
+            for series, stages in snapshot['series'].items():
+                for name, totals in stages.items():
+                    self._record(self._series.setdefault(series, {}).setdefault(name, dict.fromkeys(self.FIELDS, 0)),
+                                 totals['calls'], totals['seconds'], totals['rows'], totals['bytes'])
+
+    def log_summary(self):
+        for name, totals in sorted(self.snapshot()['stages'].items(), key=lambda item: -item[1]['seconds']):
+            logging.info(f"Stage {name}: {totals['seconds']:.2f}s over {totals['calls']} calls, "
+                         f"{totals['rows']} rows, {totals['bytes'] / 2 ** 20:.1f} MiB")
+
+
+def timed_stage(name: str, count_rows: bool = False):
+    """
+    Decorator that runs the function inside STAGE_STATS.stage(name). With count_rows, the length of the
+    result (0 for None) is added as the rows processed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_STATS.stage(name) as stage:
+                result = func(*args, **kwargs)
+                if count_rows and result is not None:
+                    stage['rows'] += len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+STAGE_STATS = StageStats()
+
+
+class RequestWeightLimiter:
+    """
+    Thread-safe sliding one-minute budget of Binance request weight.
+
+    Every request reserves its weight before it is sent; when the budget is spent,
+    callers block until the oldest reservations fall out of the window.
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, weight_per_minute: int):
+        self.weight_per_minute = weight_per_minute
+        self._lock = threading.Lock()
+        self._reservations = deque()
+        self._used = 0
+        self._paused_until = 0.0
+
+    def _expire(self, now: float):
+        while self._reservations and now - self._reservations[0][0] >= self.WINDOW_SECONDS:
+            _, weight = self._reservations.popleft()
+            self._used -= weight
+
+    def acquire(self, weight: int = 1):
+        weight = min(weight, self.weight_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._used + weight <= self.weight_per_minute:
+                    self._reservations.append((now, weight))
+                    self._used += weight
+                    return
+                else:
+                    wait = self.WINDOW_SECONDS - (now - self._reservations[0][0])
+            with STAGE_STATS.stage('rate_limit_wait'):
+                time.sleep(max(wait, 0.05))
+
+    def pause(self, seconds: float):
+        """Blocks all callers for `seconds`, e.g. after Binance answered 429/418 with a Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe_server_weight(self, used_weight: int):
+        """Accounts for weight reported by Binance that we did not reserve (e.g. other processes)."""
+        with self._lock:
+            self._expire(time.monotonic())
+            if used_weight > self._used:
+                self._reservations.append((time.monotonic(), used_weight - self._used))
+                self._used = used_weight
+
+
+REQUEST_WEIGHT_LIMITER = RequestWeightLimiter(REQUEST_WEIGHT_BUDGET_PER_MINUTE)
+
+
+class RequestStats:
+    """Thread-safe per-endpoint request counters: calls, retries, errors, bytes and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+
+    def record(self, endpoint: str, seconds: float, num_bytes: int = 0, error: bool = False, retry: bool = False):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                                                          'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['retries'] += int(retry)
+            stats['bytes'] += num_bytes
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {endpoint: dict(stats, mean_seconds=stats['total_seconds'] / stats['requests'])
+                    for endpoint, stats in self._endpoints.items()}
+
+    def log_summary(self):
+        for endpoint, stats in sorted(self.snapshot().items()):
+            logging.info(f"HTTP {endpoint}: {stats['requests']} requests, {stats['errors']} errors, "
+                         f"{stats['retries']} retries, {stats['bytes'] / 2 ** 20:.1f} MiB, "
+                         f"mean {stats['mean_seconds'] * 1000:.0f} ms, max {stats['max_seconds'] * 1000:.0f} ms")
+
+
+REQUEST_STATS = RequestStats()
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Shared keep-alive session, so the hundreds of kline requests per sweep reuse TLS connections."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                                    max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+            _http_session = session
+        return _http_session
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    retry_after = response.headers.get('Retry-After')
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+class CandleStore:
+    """
+    SQLite cache of cleaned OHLCV candles keyed by (symbol, interval, open_time in ms), plus the
+    serialized IndicatorState of each series and, for series that are younger than a full fetch, the
+    open time of their first candle on Binance.
+
+    A single connection is shared by the fetch threads and guarded by a lock; the database
+    is created on first use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS candles (symbol TEXT NOT NULL, interval TEXT NOT NULL, "
+                "open_time INTEGER NOT NULL, open REAL, high REAL, low REAL, close REAL, volume REAL, "
+                "PRIMARY KEY (symbol, interval, open_time)) WITHOUT ROWID")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS indicator_state (symbol TEXT NOT NULL, interval TEXT NOT NULL, "
+                "state TEXT NOT NULL, PRIMARY KEY (symbol, interval))")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS history_start (symbol TEXT NOT NULL, interval TEXT NOT NULL, "
+                "open_time INTEGER NOT NULL, PRIMARY KEY (symbol, interval))")
+            self._conn.commit()
+        return self._conn
+
+    @timed_stage('candle_cache', count_rows=True)
+    def load(self, symbol: str, interval: str) -> pd.DataFrame:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT open_time, open, high, low, close, volume FROM candles "
+                "WHERE symbol = ? AND interval = ? ORDER BY open_time", (symbol, interval)).fetchall()
+        df = pd.DataFrame(rows, columns=['open_time', 'open', 'high', 'low', 'close', 'volume'])
+        df['open_time'] = pd.to_datetime(df['open_time'], unit='ms', utc=True)
+        return df.set_index('open_time')
+
+    @timed_stage('candle_cache')
+    def save(self, symbol: str, interval: str, df: pd.DataFrame, keep: Optional[int]):
+        """
+        Upserts candles (replacing the previously still-open one) and keeps only the newest `keep` rows,
+        or every row when keep is None.
+        """
+        if df is None or df.empty: return
+        open_ms = (df.index.as_unit('ns').asi8 // 1_000_000).tolist()
+        rows = [(symbol, interval, t, o, h, l, c, v) for t, o, h, l, c, v in
+                zip(open_ms, *(df[col].tolist() for col in ['open', 'high', 'low', 'close', 'volume']))]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if keep is not None:
+                conn.execute(
+                    "DELETE FROM candles WHERE symbol = ? AND interval = ? AND open_time < ("
+                    "SELECT open_time FROM candles WHERE symbol = ? AND interval = ? "
+                    "ORDER BY open_time DESC LIMIT 1 OFFSET ?)", (symbol, interval, symbol, interval, keep - 1))
+            conn.commit()
+
+    def set_history_start(self, symbol: str, interval: str, open_ms: int):
+        """Records that the series has no candles before open_ms, i.e. a full fetch came back short."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO history_start VALUES (?, ?, ?)", (symbol, interval, open_ms))
+            conn.commit()
+
+    def history_start_ms(self, symbol: str, interval: str) -> Optional[int]:
+        with self._lock:
+            row = self._connect().execute("SELECT open_time FROM history_start WHERE symbol = ? AND interval = ?",
+                                          (symbol, interval)).fetchone()
+        return row[0] if row else None
+
+    def first_open_ms(self, symbol: str, interval: str) -> Optional[int]:
+        with self._lock:
+            return self._connect().execute("SELECT MIN(open_time) FROM candles WHERE symbol = ? AND interval = ?",
+                                           (symbol, interval)).fetchone()[0]
+
+    def last_open_ms(self, symbol: str, interval: str) -> Optional[int]:
+        with self._lock:
+            return self._connect().execute("SELECT MAX(open_time) FROM candles WHERE symbol = ? AND interval = ?",
+                                           (symbol, interval)).fetchone()[0]
+
+    def iter_chunks(self, symbol: str, interval: str, chunk_size: int, start_ms: int = 0) -> Iterator[pd.DataFrame]:
+        """Yields the stored candles from start_ms on, oldest first, at most chunk_size rows at a time."""
+        last_open_ms = start_ms - 1
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT open_time, open, high, low, close, volume FROM candles WHERE symbol = ? AND interval = ? "
+                    "AND open_time > ? ORDER BY open_time LIMIT ?", (symbol, interval, last_open_ms, chunk_size)
+                ).fetchall()
+            if not rows: return
+            values = np.array(rows, dtype='float64')
+            index = pd.to_datetime(values[:, 0].astype('int64'), unit='ms', utc=True).rename('open_time')
+            yield pd.DataFrame(values[:, 1:], index=index, columns=['open', 'high', 'low', 'close', 'volume'])
+            last_open_ms = rows[-1][0]
+
+    def load_indicator_state(self, symbol: str, interval: str) -> Optional['IndicatorState']:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT state FROM indicator_state WHERE symbol = ? AND interval = ?", (symbol, interval)).fetchone()
+        if row is None: return None
+        try:
+            return IndicatorState.from_json(row[0])
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"[{symbol}/{interval}] Discarding unreadable indicator state: {e}")
+            return None
+
+    def save_indicator_state(self, symbol: str, interval: str, state: 'IndicatorState'):
+        state_json = state.to_json()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?)", (symbol, interval, state_json))
+            conn.commit()
+
+
+CANDLE_STORE: Optional[CandleStore] = CandleStore(CANDLE_CACHE_FILENAME)
+
+
 def make_request(url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
-                 timeout: int = REQUEST_TIMEOUT) -> Optional[any]:
+                 timeout: int = REQUEST_TIMEOUT, weight: int = 1, raw_content: bool = False) -> Optional[any]:
+    """
+    GETs `url` through the shared session, retrying network errors and 5xx responses with jittered
+    exponential backoff. 429/418 responses pause every caller for the Retry-After the server asks for;
+    other 4xx responses are not retried.
+    """
+    endpoint = urlparse(url).path
     for attempt in range(API_RETRY_ATTEMPTS):
+        REQUEST_WEIGHT_LIMITER.acquire(weight)
+        is_last_attempt = attempt == API_RETRY_ATTEMPTS - 1
+        # Full jitter, so threads that failed together do not retry together.
+        backoff = random.uniform(0, API_RETRY_DELAY * 2 ** attempt)
+        start = time.perf_counter()
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            return response.json()
+            response = get_http_session().get(url, params=params, headers=headers, timeout=timeout)
         except requests.exceptions.RequestException as e:
+            REQUEST_STATS.record(endpoint, time.perf_counter() - start, error=True, retry=not is_last_attempt)
             logging.error(f"Request exception (attempt {attempt + 1}/{API_RETRY_ATTEMPTS}): {url} - {e}")
-        time.sleep(API_RETRY_DELAY * (attempt + 1))
+        else:
+            used_weight = response.headers.get('X-MBX-USED-WEIGHT-1M')
+            if used_weight and used_weight.isdigit():
+                REQUEST_WEIGHT_LIMITER.observe_server_weight(int(used_weight))
+            status = response.status_code
+            retryable = status >= 500 or status in (429, 418)
+            REQUEST_STATS.record(endpoint, time.perf_counter() - start, num_bytes=len(response.content),
+                                 error=status >= 400, retry=retryable and not is_last_attempt)
+            STAGE_STATS.add(num_bytes=len(response.content))
+            if status < 400:
+                try:
+                    return response.content if raw_content else response.json()
+                except ValueError as e:
+                    logging.error(f"Invalid JSON (attempt {attempt + 1}/{API_RETRY_ATTEMPTS}): {url} - {e}")
+            elif status in (429, 418):
+                retry_after = _retry_after_seconds(response) or backoff
+                logging.warning(f"Rate limited by Binance (HTTP {status}); pausing requests for {retry_after:.0f}s.")
+                if retry_after > MAX_RETRY_AFTER_WAIT:
+                    REQUEST_WEIGHT_LIMITER.pause(retry_after)
+                    logging.error(f"Retry-After of {retry_after:.0f}s is too long; giving up on {url}")
+                    return None
+                REQUEST_WEIGHT_LIMITER.pause(retry_after)
+                backoff = 0
+            elif status < 500:
+                logging.error(f"Request rejected with HTTP {status}: {url} - {response.text[:200]}")
+                return None
+            else:
+                logging.error(f"Server error HTTP {status} (attempt {attempt + 1}/{API_RETRY_ATTEMPTS}): {url}")
+        if not is_last_attempt:
+            with STAGE_STATS.stage('retry_wait'):
+                time.sleep(backoff)
     logging.error(f"Request failed after {API_RETRY_ATTEMPTS} attempts: {url}")
     return None
 
@@ -78,7 +543,7 @@ def make_request(url: str, params: Optional[Dict] = None, headers: Optional[Dict
 def get_top_volume_usdt_pairs(limit: int = 20) -> List[str]:
     url = "https://api.binance.com/api/v3/ticker/24hr"
     logging.info(f"Fetching 24h ticker data to find top {limit} USDT pairs...")
-    response_data = make_request(url)
+    response_data = make_request(url, weight=TICKER_24HR_ALL_REQUEST_WEIGHT)
     if not response_data or not isinstance(response_data, list):
         logging.error("Failed to fetch or parse ticker data from Binance.")
         return []
@@ -126,35 +591,275 @@ class BinanceAPI:
         df_cleaned = df_cleaned.sort_index()
         return df_cleaned
 
+    @staticmethod
+    @timed_stage('decode', count_rows=True)
+    def _decode_klines(content: bytes) -> np.ndarray:
+        """
+        Decodes a raw /klines response body into an (n, 6) float64 array of open_time, open, high, low,
+        close and volume.
+
+        A klines body is an array of 12-field arrays holding only numbers and numeric strings, so once the
+        brackets and quotes are stripped NumPy can parse it in C. The 7 unused fields never become Python
+        objects. Bodies of any other shape fall back to json.loads.
+        """
+        flat = content.translate(None, b'[]" \n\r\t')
+        if not flat: return np.empty((0, 6))
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', DeprecationWarning)
+                values = np.fromstring(flat, dtype=np.float64, sep=',')
+            if values.size % KLINE_FIELD_COUNT == 0:
+                return values.reshape(-1, KLINE_FIELD_COUNT)[:, :6]
+        except (ValueError, DeprecationWarning):
+            pass
+        klines_raw = json.loads(content)
+        return np.array([kline[:6] for kline in klines_raw], dtype=np.float64).reshape(-1, 6)
+
+    @staticmethod
+    def _klines_array_to_df(klines: np.ndarray) -> pd.DataFrame:
+        """Drops invalid rows, dedups on open_time (keeping the first) and sorts, all on the array."""
+        klines = klines[np.isfinite(klines).all(axis=1) & (klines[:, 1:5] > 0).all(axis=1)]
+        open_times = klines[:, 0].astype(np.int64)
+        unique_open_times, first_positions = np.unique(open_times, return_index=True)
+        index = pd.to_datetime(unique_open_times, unit='ms', utc=True).rename('open_time')
+        return pd.DataFrame(klines[first_positions, 1:6], index=index,
+                            columns=['open', 'high', 'low', 'close', 'volume'])
+
+    @staticmethod
+    def _request_klines(params: Dict) -> Optional[np.ndarray]:
+        content = make_request(f"{BinanceAPI.BASE_URL}/klines", params=params, headers=BinanceAPI.HEADERS,
+                               weight=KLINES_REQUEST_WEIGHT, raw_content=True)
+        if content is None: return None
+        try:
+            return BinanceAPI._decode_klines(content)
+        except (ValueError, TypeError, IndexError) as e:
+            logging.error(f"[{params.get('symbol')}/{params.get('interval')}] Error decoding klines: {e}.")
+            return None
+
+    @staticmethod
+    def _fetch_klines_since(symbol: str, interval: str, start_time_ms: int) -> Optional[np.ndarray]:
+        """Pages forward from start_time_ms (inclusive) up to the current, still-open candle."""
+        chunks = []
+        while True:
+            params = {"symbol": symbol.upper(), "interval": interval, "startTime": start_time_ms,
+                      "limit": HISTORICAL_DATA_CHUNK_LIMIT}
+            klines_chunk = BinanceAPI._request_klines(params)
+            if klines_chunk is None: return None
+            chunks.append(klines_chunk)
+            if len(klines_chunk) < HISTORICAL_DATA_CHUNK_LIMIT:
+                return np.concatenate(chunks)
+            start_time_ms = int(klines_chunk[-1, 0]) + 1
+
+    @staticmethod
+    def _fetch_klines_incremental(symbol: str, interval: str, num_candles: int) -> Optional[pd.DataFrame]:
+        """
+        Tops up the cached series with the candles opened since the last stored open_time.
+        Returns None when the cache cannot serve the request and a full fetch is needed.
+
+        A cache shorter than num_candles still serves when it starts at the series' recorded history
+        start (a pair listed too recently to have num_candles), so such pairs are not refetched in full.
+        """
+        interval_ms = INTERVAL_MS.get(interval)
+        if CANDLE_STORE is None or interval_ms is None: return None
+        df_cached = CANDLE_STORE.load(symbol, interval)
+        if df_cached.empty: return None
+        if len(df_cached) < num_candles:
+            history_start_ms = CANDLE_STORE.history_start_ms(symbol, interval)
+            if history_start_ms is None or int(df_cached.index[0].timestamp() * 1000) != history_start_ms:
+                return None
+        last_open_ms = int(df_cached.index[-1].timestamp() * 1000)
+        candles_behind = (int(time.time() * 1000) - last_open_ms) // interval_ms
+        if candles_behind >= num_candles: return None
+
+        logging.info(f"[{symbol}/{interval}] Fetching {candles_behind + 1} candles since the cached series...")
+        klines = BinanceAPI._fetch_klines_since(symbol, interval, last_open_ms)
+        if klines is None: return None
+        df_new = BinanceAPI._klines_array_to_df(klines)
+        CANDLE_STORE.save(symbol, interval, df_new, keep=candle_cache_keep(interval, num_candles))
+        df_combined = pd.concat([df_cached, df_new])
+        df_combined = df_combined[~df_combined.index.duplicated(keep='last')].sort_index()
+        return df_combined.tail(num_candles)
+
     @staticmethod
     def fetch_recent_klines(symbol: str, interval: str, num_candles: int) -> Optional[pd.DataFrame]:
+        """
+        Returns the most recent num_candles candles, the last of which may still be open.
+
+        attrs[FETCHED_AT_ATTR] is set to the time just before the first request, so split_closed_candles
+        can tell which candles were already closed in the response however long the sweep takes after.
+        """
+        fetched_at_ms = int(time.time() * 1000)
+        df = BinanceAPI._fetch_klines_incremental(symbol, interval, num_candles)
+        if df is None:
+            df = BinanceAPI._fetch_klines_full(symbol, interval, num_candles)
+        if df is not None:
+            df.attrs[FETCHED_AT_ATTR] = fetched_at_ms
+        return df
+
+    @staticmethod
+    def _fetch_klines_full(symbol: str, interval: str, num_candles: int) -> Optional[pd.DataFrame]:
         logging.info(f"[{symbol}/{interval}] Fetching the most recent {num_candles} candles...")
-        all_klines_list = []
+        chunks = []
+        fetched_count = 0
         end_time_ms = None
         calls_needed = math.ceil(num_candles / HISTORICAL_DATA_CHUNK_LIMIT)
         for i in range(calls_needed):
-            limit = min(num_candles - len(all_klines_list), HISTORICAL_DATA_CHUNK_LIMIT)
+            limit = min(num_candles - fetched_count, HISTORICAL_DATA_CHUNK_LIMIT)
             params = {"symbol": symbol.upper(), "interval": interval, "limit": limit}
             if end_time_ms:
                 params["endTime"] = end_time_ms
-            url = f"{BinanceAPI.BASE_URL}/klines"
-            klines_chunk_raw = make_request(url, params=params, headers=BinanceAPI.HEADERS)
-            if klines_chunk_raw is None: return None
-            if not klines_chunk_raw: break
-            all_klines_list = klines_chunk_raw + all_klines_list
-            end_time_ms = klines_chunk_raw[0][0] - 1
-            if len(all_klines_list) >= num_candles:
+            klines_chunk = BinanceAPI._request_klines(params)
+            if klines_chunk is None: return None
+            if len(klines_chunk) == 0: break
+            chunks.insert(0, klines_chunk)
+            fetched_count += len(klines_chunk)
+            end_time_ms = int(klines_chunk[0, 0]) - 1
+            if fetched_count >= num_candles:
                 break
-            time.sleep(0.3)
-        if not all_klines_list:
+        if not chunks:
             logging.warning(f"[{symbol}/{interval}] No data fetched.")
             return pd.DataFrame()
-        df_fetched = BinanceAPI._process_raw_klines_to_df(all_klines_list, symbol, interval)
-        df_cleaned = BinanceAPI._clean_historical_df(df_fetched)
+        df_cleaned = BinanceAPI._klines_array_to_df(np.concatenate(chunks))
+        if CANDLE_STORE is not None:
+            CANDLE_STORE.save(symbol, interval, df_cleaned, keep=candle_cache_keep(interval, num_candles))
+            if fetched_count < num_candles and not df_cleaned.empty:
+                # Binance ran out of candles: the series starts here, and the shorter cache is complete.
+                CANDLE_STORE.set_history_start(symbol, interval, int(df_cleaned.index[0].timestamp() * 1000))
         return df_cleaned.tail(num_candles)
 
 
+def fetch_klines_concurrently(jobs: List[Tuple[str, str, int]], max_workers: int = MAX_FETCH_WORKERS
+                              ) -> Dict[Tuple[str, str], Optional[pd.DataFrame]]:
+    """
+    Fetches (symbol, interval, num_candles) jobs on a bounded thread pool.
+
+    Pacing is left to the shared REQUEST_WEIGHT_LIMITER, so the pool can run as fast as the
+    Binance weight budget allows. Logs the wall-clock time against the summed per-job time,
+    which is what a sequential sweep would have taken.
+    """
+    results: Dict[Tuple[str, str], Optional[pd.DataFrame]] = {}
+    if not jobs: return results
+
+    def timed_fetch(symbol: str, interval: str, num_candles: int) -> Tuple[Optional[pd.DataFrame], float]:
+        job_start = time.perf_counter()
+        with STAGE_STATS.stage('fetch', symbol, interval) as stage:
+            df = BinanceAPI.fetch_recent_klines(symbol, interval, num_candles)
+            stage['rows'] = len(df) if df is not None else 0
+        return df, time.perf_counter() - job_start
+
+    sweep_start = time.perf_counter()
+    sequential_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(timed_fetch, symbol, interval, num_candles): (symbol, interval)
+                   for symbol, interval, num_candles in jobs}
+        for future in as_completed(futures):
+            symbol, interval = futures[future]
+            try:
+                df, job_seconds = future.result()
+                sequential_seconds += job_seconds
+            except Exception as e:
+                logging.error(f"[{symbol}/{interval}] Fetch job failed: {e}", exc_info=True)
+                df = None
+            results[(symbol, interval)] = df
+    wall_seconds = time.perf_counter() - sweep_start
+    speedup = sequential_seconds / wall_seconds if wall_seconds > 0 else 0.0
+    logging.info(f"Fetched {len(jobs)} series in {wall_seconds:.2f}s with {max_workers} workers "
+                 f"(sequential estimate {sequential_seconds:.2f}s, speedup x{speedup:.1f}).")
+    return results
+
+
+@timed_stage('resample', count_rows=True)
+def resample_klines(df_base: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    Aggregates base-interval OHLCV into `interval` candles on Binance's epoch-aligned boundaries.
+
+    Buckets are formed with reduceat over the sorted open times, so gaps in the base series simply
+    shrink a bucket. A leading bucket that started before the first base candle is dropped, as
+    its open and volume would be wrong; the trailing bucket may be partial, like the open candle
+    Binance returns.
+    """
+    if df_base.empty: return df_base.copy()
+    step = INTERVAL_MS[interval]
+    open_ms = df_base.index.as_unit('ns').asi8 // 1_000_000
+    bucket_ms = open_ms - open_ms % step
+    starts = np.flatnonzero(np.r_[True, bucket_ms[1:] != bucket_ms[:-1]])
+    if bucket_ms[0] != open_ms[0]:
+        starts = starts[1:]
+    if len(starts) == 0: return df_base.iloc[:0].copy()
+    ends = np.r_[starts[1:], len(open_ms)] - 1
+    values = df_base[['open', 'high', 'low', 'close', 'volume']].to_numpy()
+    index = pd.to_datetime(bucket_ms[starts], unit='ms', utc=True).rename('open_time')
+    df = pd.DataFrame({'open': values[starts, 0],
+                         'high': np.maximum.reduceat(values[starts[0]:, 1], starts - starts[0]),
+                         'low': np.minimum.reduceat(values[starts[0]:, 2], starts - starts[0]),
+                         'close': values[ends, 3],
+                         'volume': np.add.reduceat(values[starts[0]:, 4], starts - starts[0])}, index=index)
+    df.attrs.update(df_base.attrs)  # Keeps FETCHED_AT_ATTR, so the open bucket is still recognised.
+    return df
+
+
+def plan_fetch_jobs(symbols: List[str], timeframes: List[str]) -> Tuple[List[Tuple[str, str, int]], Dict[str, int]]:
+    """
+    Returns the (symbol, interval, num_candles) fetch jobs for a sweep and the candles needed per timeframe.
+
+    Derived timeframes add no jobs of their own; instead the BASE_INTERVAL job grows to cover the
+    longest of them, with one extra bucket for the partial leading one resample_klines drops.
+    """
+    needed = {tf: ANALYSIS_CANDLE_COUNTS.get(tf, DEFAULT_ANALYSIS_CANDLE_COUNT) + MIN_CANDLES_FOR_INDICATORS
+              for tf in timeframes}
+    fetched = {tf: count for tf, count in needed.items() if tf not in DERIVED_TIMEFRAMES}
+    for tf in timeframes:
+        if tf in DERIVED_TIMEFRAMES:
+            base_count = (needed[tf] + 1) * (INTERVAL_MS[tf] // INTERVAL_MS[BASE_INTERVAL])
+            fetched[BASE_INTERVAL] = max(fetched.get(BASE_INTERVAL, 0), base_count)
+    return [(symbol, tf, count) for symbol in symbols for tf, count in fetched.items()], needed
+
+
+def candle_cache_keep(interval: str, num_candles: int) -> int:
+    """
+    Rows to keep cached for `interval` after a fetch of num_candles: never fewer than a batch sweep of
+    TIMEFRAMES fetches, so a --stream session, which needs only a few hundred BASE_INTERVAL candles, does
+    not trim away the history the derived timeframes are resampled from.
+    """
+    jobs, _ = plan_fetch_jobs(['_'], TIMEFRAMES)
+    return max([num_candles] + [count for _, job_interval, count in jobs if job_interval == interval])
+
+
+def assemble_series(symbols: List[str], timeframes: List[str], fetched: Dict[Tuple[str, str], Optional[pd.DataFrame]],
+                    needed_candles: Dict[str, int], only: Optional[Set[Tuple[str, str]]] = None
+                    ) -> Tuple[List[Tuple[str, str, pd.DataFrame, int]], List[Tuple[str, str, pd.DataFrame]]]:
+    """
+    Turns the frames fetched for plan_fetch_jobs into analyze_all_series jobs, resampling the derived
+    timeframes from BASE_INTERVAL. Series not in `only` are left out.
+
+    Returns the jobs and the (symbol, timeframe, df_raw) series that were fetched but are too short to
+    analyse (e.g. a recent listing); series whose fetch failed are in neither list.
+    """
+    series, too_short = [], []
+    for symbol in symbols:
+        for timeframe in timeframes:
+            if only is not None and (symbol, timeframe) not in only: continue
+            total_candles_to_fetch = needed_candles[timeframe]
+            if timeframe in DERIVED_TIMEFRAMES:
+                df_base = fetched.get((symbol, BASE_INTERVAL))
+                df_raw = resample_klines(df_base, timeframe) if df_base is not None else None
+            else:
+                df_raw = fetched.get((symbol, timeframe))
+            # Same length as a direct fetch of this timeframe, so the EMAs are seeded from the same candle
+            # (the BASE_INTERVAL frame itself is fetched longer, for the derived timeframes).
+            if df_raw is not None:
+                df_raw = df_raw.tail(total_candles_to_fetch)
+            if df_raw is None or len(df_raw) < total_candles_to_fetch:
+                logging.warning(f"Could not fetch enough data for {symbol}/{timeframe}. Skipping.")
+                if df_raw is not None:
+                    too_short.append((symbol, timeframe, df_raw))
+                continue
+            series.append((symbol, timeframe, df_raw, total_candles_to_fetch - MIN_CANDLES_FOR_INDICATORS))
+    return series, too_short
+
+
 # --- Logic Functions ---
+@timed_stage('indicators', count_rows=True)
 def calculate_indicators(df: pd.DataFrame) -> Optional[pd.DataFrame]:
     if df is None or df.empty or len(df) < MIN_CANDLES_FOR_INDICATORS:
         return None
@@ -163,6 +868,11 @@ def calculate_indicators(df: pd.DataFrame) -> Optional[pd.DataFrame]:
         df_res[f'SMA_{period}'] = df_res['close'].rolling(window=period).mean()
     for period in [EMA_SHORT_PERIOD, EMA_LONG_PERIOD]:
         df_res[f'EMA_{period}'] = df_res['close'].ewm(span=period, adjust=False).mean()
+    return classify_market_state(df_res)
+
+
+def classify_market_state(df_res: pd.DataFrame) -> pd.DataFrame:
+    """Sets the Green/Red/Grey 'market_state' column from the SMA/EMA columns, in place."""
     ema_s, ema_l = f'EMA_{EMA_SHORT_PERIOD}', f'EMA_{EMA_LONG_PERIOD}'
     sma_s, sma_l = f'SMA_{SMA_SHORT_PERIOD}', f'SMA_{SMA_LONG_PERIOD}'
     df_res['market_state'] = "Grey"
@@ -175,6 +885,72 @@ def calculate_indicators(df: pd.DataFrame) -> Optional[pd.DataFrame]:
     return df_res
 
 
+def calculate_indicator_matrix(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Computes the SMA/EMA columns and market-state codes for a whole (time x symbol) close matrix at once.
+
+    NaN marks a candle a symbol does not have. Each column's valid closes are packed to the bottom
+    of the matrix with a stable sort, so one rolling/ewm pass over all columns sees every symbol's
+    own consecutive candles, exactly as calculate_indicators would; results are then scattered
+    back to their time rows. Returns float matrices keyed like the calculate_indicators columns,
+    plus 'market_state' as MARKET_STATE_CODES ints (-1 where the candle is missing).
+    """
+    valid = ~np.isnan(closes)
+    order = np.argsort(valid, axis=0, kind='stable')
+    packed = pd.DataFrame(np.take_along_axis(closes, order, axis=0))
+
+    def unpack(values: np.ndarray) -> np.ndarray:
+        result = np.empty_like(values)
+        np.put_along_axis(result, order, values, axis=0)
+        return result
+
+    matrices: Dict[str, np.ndarray] = {}
+    for period in [SMA_SHORT_PERIOD, SMA_LONG_PERIOD]:
+        matrices[f'SMA_{period}'] = unpack(packed.rolling(window=period).mean().to_numpy())
+    for period in [EMA_SHORT_PERIOD, EMA_LONG_PERIOD]:
+        matrices[f'EMA_{period}'] = unpack(packed.ewm(span=period, adjust=False).mean().to_numpy())
+
+    ema_s, ema_l = matrices[f'EMA_{EMA_SHORT_PERIOD}'], matrices[f'EMA_{EMA_LONG_PERIOD}']
+    sma_s, sma_l = matrices[f'SMA_{SMA_SHORT_PERIOD}'], matrices[f'SMA_{SMA_LONG_PERIOD}']
+    long_cond = (ema_s > ema_l) & (sma_s > sma_l) & (ema_s > sma_l) & (sma_s > ema_l)
+    short_cond = (ema_s < ema_l) & (sma_s < sma_l) & (ema_s < sma_l) & (sma_s < ema_l)
+    states = np.select([long_cond, short_cond], [MARKET_STATE_CODES['Green'], MARKET_STATE_CODES['Red']],
+                       MARKET_STATE_CODES['Grey'])
+    matrices['market_state'] = np.where(valid, states, -1)
+    return matrices
+
+
+@timed_stage('indicators_batch', count_rows=True)
+def calculate_indicators_batch(frames: Dict[str, pd.DataFrame]) -> Dict[str, Optional[pd.DataFrame]]:
+    """
+    calculate_indicators for many symbols of one timeframe in a single matrix pass.
+
+    The frames are outer-joined on open_time into a (time x symbol) close matrix, so the cost grows
+    with the number of candles far more than with the number of symbols. Symbols with too little
+    data map to None, like calculate_indicators.
+    """
+    results: Dict[str, Optional[pd.DataFrame]] = {symbol: None for symbol in frames}
+    usable = {symbol: df for symbol, df in frames.items()
+              if df is not None and len(df) >= MIN_CANDLES_FOR_INDICATORS}
+    if not usable: return results
+    symbols = list(usable)
+    index = usable[symbols[0]].index
+    for symbol in symbols[1:]:
+        index = index.union(usable[symbol].index)
+    closes = np.column_stack([usable[symbol]['close'].reindex(index).to_numpy(dtype='float64')
+                              for symbol in symbols])
+    matrices = calculate_indicator_matrix(closes)
+    state_names = np.array(sorted(MARKET_STATE_CODES, key=MARKET_STATE_CODES.get), dtype=object)
+    for col, symbol in enumerate(symbols):
+        df = usable[symbol]
+        rows = index.get_indexer(df.index)
+        columns = {name: df[name].to_numpy(copy=True) for name in df.columns}
+        columns.update((name, matrix[rows, col]) for name, matrix in matrices.items() if name != 'market_state')
+        columns['market_state'] = state_names[matrices['market_state'][rows, col]]
+        results[symbol] = pd.DataFrame(columns, index=df.index)
+    return results
+
+
 def calculate_levels_at_transition(df: pd.DataFrame, idx: int, setup_type: str) -> Optional[Dict[str, float]]:
     if not (0 <= idx < len(df)): return None
     start_slice_idx = idx - 1
@@ -233,205 +1009,1335 @@ def check_and_update_setups_for_candle(symbol: str, timeframe: str, df: pd.DataF
     return signals
 
 
-# --- NEW: Function to load existing signals from JSON files ---
-def load_existing_signals() -> Tuple[Set[Tuple[str, str, str]], Dict[str, List[Dict]]]:
+MARKET_STATE_CODES = {'Grey': 0, 'Green': 1, 'Red': 2}
+
+
+def _setup_from_dict(setup: Dict) -> List:
+    """Unpacks a setup dict into [active, transition_ns, original, running, json_resistance, json_stoploss]."""
+    if not setup.get('active'):
+        return [False, None, 0.0, 0.0, 0.0, 0.0]
+    return [True, pd.Timestamp(setup['transition_time']).value, setup['original_level'], setup['running_level'],
+            setup['json_resistance_level'], setup['json_stoploss_level']]
+
+
+@timed_stage('signals')
+def scan_setups_for_series(symbol: str, timeframe: str, df: pd.DataFrame, green_setup: Dict, red_setup: Dict,
+                           start_idx: int = 1) -> List[Dict]:
+    """
+    Array-based equivalent of calling check_and_update_setups_for_candle for every idx in
+    [start_idx, len(df)), producing the same signals and leaving the setup dicts in the same state.
+
+    The OHLC and market_state columns are extracted once. The start of the Grey run preceding each
+    candle is precomputed with a cumulative max over the positions of non-Grey candles, so a
+    transition's levels are a single slice min/max instead of a row-by-row walk back.
+    """
+    signals = []
+    n = len(df)
+    if n < 2 or start_idx >= n: return signals
+    start_idx = max(start_idx, 1)
+    STAGE_STATS.add(rows=n - start_idx)
+
+    opens, closes = df['open'].to_numpy(), df['close'].to_numpy()
+    highs, lows = df['high'].to_numpy(), df['low'].to_numpy()
+    index = df.index
+    times_ns = index.as_unit('ns').asi8
+    states = df['market_state'].map(MARKET_STATE_CODES).fillna(-1).to_numpy(dtype='int64')
+    state_na = df['market_state'].isna().to_numpy()
+
+    positions = np.arange(n)
+    last_non_grey = np.maximum.accumulate(np.where(states != MARKET_STATE_CODES['Grey'], positions, -1))
+    transition_slice_start = np.empty(n, dtype='int64')
+    transition_slice_start[0] = 0
+    transition_slice_start[1:] = last_non_grey[:-1] + 1
+
+    # Plain Python lists make the per-candle loop below much cheaper than element-wise NumPy access.
+    opens_l, closes_l, highs_l, lows_l = opens.tolist(), closes.tolist(), highs.tolist(), lows.tolist()
+    states_l, state_na_l, times_l = states.tolist(), state_na.tolist(), times_ns.tolist()
+    grey, green, red = MARKET_STATE_CODES['Grey'], MARKET_STATE_CODES['Green'], MARKET_STATE_CODES['Red']
+
+    g_active, g_time, g_original, g_running, g_json_res, g_json_sl = _setup_from_dict(green_setup)
+    r_active, r_time, r_original, r_running, r_json_res, r_json_sl = _setup_from_dict(red_setup)
+    g_transition_idx = r_transition_idx = None
+
+    for idx in range(start_idx, n):
+        if state_na_l[idx] or state_na_l[idx - 1]: continue
+        cc_state, pc_state, cc_time = states_l[idx], states_l[idx - 1], times_l[idx]
+        if cc_state == green and (pc_state == grey or pc_state == red):
+            slice_start = transition_slice_start[idx]
+            g_active, g_time, g_transition_idx = True, cc_time, idx
+            g_original = g_running = g_json_res = lows[slice_start: idx + 1].min()
+            g_json_sl = highs[slice_start: idx + 1].max()
+        if cc_state == red and (pc_state == grey or pc_state == green):
+            slice_start = transition_slice_start[idx]
+            r_active, r_time, r_transition_idx = True, cc_time, idx
+            r_original = r_running = r_json_res = highs[slice_start: idx + 1].max()
+            r_json_sl = lows[slice_start: idx + 1].min()
+        cc_open, cc_close = opens_l[idx], closes_l[idx]
+        if g_active and g_time != cc_time:
+            if cc_open < g_original and cc_close < g_running:
+                signals.append({'symbol': symbol, 'timeframe': timeframe, 'type': 'Green', 'reason': 'Triggered',
+                                'transition_time': index[g_transition_idx] if g_transition_idx is not None
+                                else green_setup['transition_time'], 'alert_time': index[idx],
+                                'alert_candle_close': closes[idx], 'json_resistance_val': g_json_res,
+                                'json_stoploss_val': g_json_sl})
+                g_active = False
+            elif lows_l[idx] < g_running:
+                g_running = lows[idx]
+        if r_active and r_time != cc_time:
+            if cc_open > r_original and cc_close > r_running:
+                signals.append({'symbol': symbol, 'timeframe': timeframe, 'type': 'Red', 'reason': 'Triggered',
+                                'transition_time': index[r_transition_idx] if r_transition_idx is not None
+                                else red_setup['transition_time'], 'alert_time': index[idx],
+                                'alert_candle_close': closes[idx], 'json_resistance_val': r_json_res,
+                                'json_stoploss_val': r_json_sl})
+                r_active = False
+            elif highs_l[idx] > r_running:
+                r_running = highs[idx]
+
+    for setup, transition_idx, values in ((green_setup, g_transition_idx, (g_active, g_time, g_original, g_running,
+                                                                           g_json_res, g_json_sl)),
+                                          (red_setup, r_transition_idx, (r_active, r_time, r_original, r_running,
+                                                                         r_json_res, r_json_sl))):
+        active, transition_ns, original, running, json_res, json_sl = values
+        if transition_idx is not None or setup.get('active'):
+            transition_time = index[transition_idx] if transition_idx is not None else setup['transition_time']
+            setup.update({'active': active, 'transition_time': transition_time, 'original_level': original,
+                          'running_level': running, 'json_resistance_level': json_res,
+                          'json_stoploss_level': json_sl})
+    return signals
+
+
+def _setup_to_json(setup: Dict) -> Dict:
+    setup_json = {k: float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+                  for k, v in setup.items()}
+    if 'transition_time' in setup_json:
+        setup_json['transition_time'] = pd.Timestamp(setup_json['transition_time']).value // 1_000_000
+    return setup_json
+
+
+def _setup_from_json(setup_json: Dict) -> Dict:
+    setup = dict(setup_json)
+    if 'transition_time' in setup:
+        setup['transition_time'] = pd.Timestamp(setup['transition_time'], unit='ms', tz='UTC')
+    return setup
+
+
+class IndicatorState:
     """
-    Loads all previously found signals from the JSON report files.
+    Streaming SMA/EMA/market_state and open setups for one (symbol, timeframe) series.
 
-    Returns:
-        A tuple containing:
-        - A set of unique signal identifiers for fast checking.
-        - A dictionary with lists of the full signal data, keyed by timeframe.
+    Seeded once from a batch calculate_indicators frame, then advanced by only the newly closed
+    candles. `tail` holds the last non-Grey candle and the Grey run after it, which is all the
+    setup state machine ever looks back at.
     """
-    logging.info("Loading existing signals from previous runs...")
-    existing_signals_set = set()
-    existing_signals_by_tf = {tf: [] for tf in TIMEFRAMES}
 
-    # Reverse map to convert GUI timeframe names back to script-compatible names
-    script_tf_map = {v: k for k, v in _temp_map_tf_for_gui_slots.items()}
+    SMA_PERIODS = (SMA_SHORT_PERIOD, SMA_LONG_PERIOD)
+    EMA_PERIODS = (EMA_SHORT_PERIOD, EMA_LONG_PERIOD)
+    TAIL_COLUMNS = ['open', 'high', 'low', 'close', 'market_state']
+    # Matches the batch scan, whose walk back over a Grey run never leaves the analysis window.
+    MAX_TAIL_ROWS = max(ANALYSIS_CANDLE_COUNTS.values())
+    # Below this many new candles a plain loop beats setting up a pandas ewm.
+    EMA_VECTORIZE_MIN_CANDLES = 64
+
+    def __init__(self, closes_window: List[float], ema_values: Dict[int, float], tail: pd.DataFrame,
+                 green_setup: Dict, red_setup: Dict):
+        self.closes_window = deque(closes_window, maxlen=max(self.SMA_PERIODS) + 1)
+        self.ema_values = dict(ema_values)
+        self.tail = tail
+        self.green_setup = green_setup
+        self.red_setup = red_setup
+
+    @property
+    def last_open_time(self) -> pd.Timestamp:
+        return self.tail.index[-1]
+
+    @classmethod
+    def from_indicator_frame(cls, df_processed: pd.DataFrame, green_setup: Dict, red_setup: Dict
+                             ) -> 'IndicatorState':
+        """Seeds the state from a calculate_indicators frame whose last row is the last closed candle."""
+        ema_values = {period: float(df_processed[f'EMA_{period}'].iloc[-1]) for period in cls.EMA_PERIODS}
+        closes_window = df_processed['close'].tail(max(cls.SMA_PERIODS) + 1).tolist()
+        return cls(closes_window, ema_values, cls._trim_tail(df_processed[cls.TAIL_COLUMNS]), green_setup, red_setup)
+
+    @classmethod
+    def _trim_tail(cls, df: pd.DataFrame) -> pd.DataFrame:
+        non_grey_positions = np.flatnonzero(df['market_state'].to_numpy() != 'Grey')
+        start = non_grey_positions[-1] if len(non_grey_positions) else 0
+        return df.iloc[max(start, len(df) - cls.MAX_TAIL_ROWS):]
+
+    @timed_stage('indicators', count_rows=True)
+    def update_indicators(self, df_new: pd.DataFrame) -> pd.DataFrame:
+        """Returns df_new with SMA/EMA/market_state columns, continuing from the carried state."""
+        closes = df_new['close'].to_numpy(dtype='float64')
+        history = np.fromiter(self.closes_window, dtype='float64', count=len(self.closes_window))
+        extended_closes = np.concatenate([history, closes])
+        arrays = {}
+        for period in self.SMA_PERIODS:
+            sma = np.full(len(closes), np.nan)
+            first = max(len(history), period - 1)  # First position in extended_closes with a full window.
+            if first < len(extended_closes):
+                windows = np.lib.stride_tricks.sliding_window_view(extended_closes[first - period + 1:], period)
+                sma[first - len(history):] = windows.mean(axis=1)
+            arrays[f'SMA_{period}'] = sma
+        for period in self.EMA_PERIODS:
+            # Same adjust=False recursion as calculate_indicators, restarted from the carried value.
+            if len(closes) > self.EMA_VECTORIZE_MIN_CANDLES:
+                seeded_closes = pd.Series(np.concatenate([[self.ema_values[period]], closes]))
+                ema = seeded_closes.ewm(span=period, adjust=False).mean().to_numpy()[1:]
+            else:
+                alpha, value, ema = 2.0 / (period + 1), self.ema_values[period], np.empty(len(closes))
+                for i, close in enumerate(closes.tolist()):
+                    value = (1 - alpha) * value + alpha * close
+                    ema[i] = value
+            arrays[f'EMA_{period}'] = ema
+            if len(ema):
+                self.ema_values[period] = float(ema[-1])
+        self.closes_window.extend(closes[-self.closes_window.maxlen:].tolist())
+
+        ema_s, ema_l = arrays[f'EMA_{EMA_SHORT_PERIOD}'], arrays[f'EMA_{EMA_LONG_PERIOD}']
+        sma_s, sma_l = arrays[f'SMA_{SMA_SHORT_PERIOD}'], arrays[f'SMA_{SMA_LONG_PERIOD}']
+        # Same conditions as classify_market_state, on arrays to avoid pandas overhead for a few rows.
+        long_cond = (ema_s > ema_l) & (sma_s > sma_l) & (ema_s > sma_l) & (sma_s > ema_l)
+        short_cond = (ema_s < ema_l) & (sma_s < sma_l) & (ema_s < sma_l) & (sma_s < ema_l)
+        market_state = np.where(long_cond, "Green", np.where(short_cond, "Red", "Grey")).astype(object)
+        return df_new.assign(**arrays, market_state=market_state)
+
+    def advance(self, symbol: str, timeframe: str, df_new: pd.DataFrame) -> List[Dict]:
+        """Feeds candles newer than last_open_time through the indicators and setups; returns new signals."""
+        if df_new.empty: return []
+        df_new = self.update_indicators(df_new)
+        combined = pd.concat([self.tail, df_new[self.TAIL_COLUMNS]])
+        signals = scan_setups_for_series(symbol, timeframe, combined, self.green_setup, self.red_setup,
+                                         start_idx=len(self.tail))
+        self.tail = self._trim_tail(combined)
+        return signals
+
+    def to_json(self) -> str:
+        tail_open_ms = (self.tail.index.as_unit('ns').asi8 // 1_000_000).tolist()
+        return json.dumps({
+            'closes_window': list(self.closes_window),
+            'ema_values': {str(period): value for period, value in self.ema_values.items()},
+            'tail': {'open_time': tail_open_ms, **{col: self.tail[col].tolist() for col in self.TAIL_COLUMNS}},
+            'green_setup': _setup_to_json(self.green_setup),
+            'red_setup': _setup_to_json(self.red_setup),
+        })
+
+    @classmethod
+    def from_json(cls, text: str) -> 'IndicatorState':
+        data = json.loads(text)
+        tail = pd.DataFrame({col: data['tail'][col] for col in cls.TAIL_COLUMNS},
+                            index=pd.to_datetime(data['tail']['open_time'], unit='ms', utc=True))
+        tail.index.name = 'open_time'
+        return cls(data['closes_window'], {int(period): value for period, value in data['ema_values'].items()},
+                   tail, _setup_from_json(data['green_setup']), _setup_from_json(data['red_setup']))
+
+
+def split_closed_candles(df: pd.DataFrame, interval: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Splits a fetched series into closed candles and the still-open trailing candle (if any).
+
+    Candles count as closed if they closed before the series was fetched (attrs[FETCHED_AT_ATTR]), not
+    before now: a candle that was open in the response but closes during a long sweep still holds partial
+    OHLC. Frames without the attribute (e.g. read back from a store) are split against the current time.
+    """
+    interval_ms = INTERVAL_MS.get(interval)
+    if interval_ms is None or df.empty: return df, df.iloc[:0]
+    as_of_ms = df.attrs.get(FETCHED_AT_ATTR)
+    as_of = pd.Timestamp(as_of_ms if as_of_ms is not None else int(time.time() * 1000), unit='ms', tz='UTC')
+    num_closed = int(np.searchsorted(df.index, as_of - pd.Timedelta(milliseconds=interval_ms), side='right'))
+    return df.iloc[:num_closed], df.iloc[num_closed:]
+
+
+class SignalIndex:
+    """
+    Compact set of reported (symbol, timeframe, 'YYYY-MM-DD HH:MM') signal ids for deduplication.
+
+    Each id is packed into one int64: an interned symbol id, an interned timeframe id and the epoch
+    minute of the entry. Keys loaded from disk stay in a sorted array (8 bytes per signal, looked up
+    with searchsorted); only keys added during the run live in a Python set. Ids that do not fit the
+    packing (e.g. an unusual entry_date) are kept as plain tuples.
+    """
+
+    TIMEFRAME_BITS = 4
+    MINUTE_BITS = 32
+
+    def __init__(self, symbols: List[str] = (), timeframes: List[str] = (), keys: Optional[np.ndarray] = None,
+                 unpacked: Set[Tuple[str, str, str]] = ()):
+        self.symbols = list(symbols)
+        self.timeframes = list(timeframes)
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._timeframe_ids = {timeframe: i for i, timeframe in enumerate(self.timeframes)}
+        self._keys = keys if keys is not None else np.empty(0, dtype=np.int64)
+        self._added: Set[int] = set()
+        self._unpacked: Set[Tuple[str, str, str]] = set(unpacked)
+
+    def _pack(self, signal_id: Tuple[str, str, str], intern: bool) -> Optional[int]:
+        symbol, timeframe, entry_date = signal_id
+        if len(entry_date) != 16: return None
+        try:
+            minute = _entry_date_to_ms(entry_date) // 60_000
+        except ValueError:
+            return None
+        symbol_id, timeframe_id = self._symbol_ids.get(symbol), self._timeframe_ids.get(timeframe)
+        if intern and symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        if intern and timeframe_id is None and len(self.timeframes) < 2 ** self.TIMEFRAME_BITS:
+            timeframe_id = self._timeframe_ids[timeframe] = len(self.timeframes)
+            self.timeframes.append(timeframe)
+        if symbol_id is None or timeframe_id is None or not 0 <= minute < 2 ** self.MINUTE_BITS: return None
+        return (symbol_id << (self.TIMEFRAME_BITS + self.MINUTE_BITS)) | (timeframe_id << self.MINUTE_BITS) | minute
+
+    def __contains__(self, signal_id: Tuple[str, str, str]) -> bool:
+        key = self._pack(signal_id, intern=False)
+        if key is None:
+            return signal_id in self._unpacked
+        return self._has_key(key)
+
+    def _has_key(self, key: int) -> bool:
+        position = int(np.searchsorted(self._keys, key))
+        return (position < len(self._keys) and self._keys[position] == key) or key in self._added
+
+    def add(self, signal_id: Tuple[str, str, str]):
+        key = self._pack(signal_id, intern=True)
+        if key is None:
+            self._unpacked.add(signal_id)
+        elif not self._has_key(key):
+            self._added.add(key)
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._added) + len(self._unpacked)
+
+    def save(self, path: str, report_stamps: Dict[str, Optional[List[int]]]):
+        """Writes the index with the (size, mtime_ns) of the reports it was built from, for validation on load."""
+        keys = np.union1d(self._keys, np.fromiter(self._added, dtype=np.int64, count=len(self._added)))
+        meta = {'report_stamps': report_stamps, 'timeframes': self.timeframes, 'unpacked': sorted(self._unpacked)}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=keys, symbols=np.array(self.symbols, dtype=str), meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, path)
+        self._keys, self._added = keys, set()
 
+    @classmethod
+    def load(cls, path: str, report_stamps: Dict[str, Optional[List[int]]]) -> Optional['SignalIndex']:
+        """Returns the persisted index, or None if it is missing, unreadable or older than the reports."""
+        if not os.path.exists(path): return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta['report_stamps'] != report_stamps: return None
+                return cls(data['symbols'].tolist(), meta['timeframes'], data['keys'],
+                           {tuple(signal_id) for signal_id in meta['unpacked']})
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Discarding unreadable signal index {path}: {e}")
+            return None
+
+
+def _report_stamps() -> Dict[str, Optional[List[int]]]:
+    stamps = {}
     for timeframe in TIMEFRAMES:
         filename = f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'r') as f:
-                    data = json.load(f)
-                    if data and isinstance(data, list) and 'sections' in data[0]:
-                        # --- MODIFIED: Store the full signal dict to be re-saved later ---
-                        existing_signals_by_tf[timeframe] = data[0]['sections']
-                        for signal in data[0]['sections']:
-                            # Get script-compatible timeframe name for the unique ID
-                            gui_tf = signal.get('timeframe_name', '')
-                            script_tf = script_tf_map.get(gui_tf, gui_tf)
-                            # Create a unique identifier for the signal
-                            signal_id = (signal.get('symbol'), script_tf, signal.get('entry_date'))
-                            if all(signal_id):  # Ensure no None values
-                                existing_signals_set.add(signal_id)
+        stat = os.stat(filename) if os.path.exists(filename) else None
+        stamps[timeframe] = [stat.st_size, stat.st_mtime_ns] if stat else None
+    return stamps
 
-            except (json.JSONDecodeError, IOError, IndexError) as e:
-                logging.warning(
-                    f"Could not read or parse existing report {filename}. It will be overwritten. Error: {e}")
 
-    logging.info(f"Loaded {len(existing_signals_set)} unique signals from previous runs.")
-    return existing_signals_set, existing_signals_by_tf
+def read_report_sections(timeframe: str) -> List[Dict]:
+    filename = f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
+    if not os.path.exists(filename): return []
+    try:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        if data and isinstance(data, list) and 'sections' in data[0]:
+            return data[0]['sections']
+    except (json.JSONDecodeError, IOError, IndexError, ValueError) as e:
+        logging.warning(f"Could not read or parse existing report {filename}. It will be overwritten. Error: {e}")
+    return []
 
 
-def generate_timeframe_json_report(signals_list: List[Dict], filename: str):
-    # This function now takes a list of signal dictionaries directly
-    def map_tf_to_gui_name(tf: str) -> str:
-        return _temp_map_tf_for_gui_slots.get(tf, tf)
+class ReportRecords(dict):
+    """{timeframe: [SignalRecord]} that parses a timeframe's report only when it is first accessed."""
 
-    def fmt_val(v, p=4):
-        return f"{v:.{p}f}" if isinstance(v, (int, float)) and pd.notna(v) else ""
+    def __missing__(self, timeframe: str) -> List['SignalRecord']:
+        records = [SignalRecord.from_signal(signal) for signal in read_report_sections(timeframe)]
+        self[timeframe] = records
+        return records
 
-    # --- CORRECTED: Helper function for sorting ---
-    def get_sort_key(signal_dict):
-        """Ensures the date is a datetime object for sorting."""
-        date_val = signal_dict.get('alert_time', signal_dict.get('entry_date'))
-        if isinstance(date_val, str):
-            # Convert the string to a datetime object AND make it timezone-aware (UTC)
-            return pd.to_datetime(date_val, utc=True)
-        return date_val
 
-    if not signals_list:
-        # Handle case where there are no signals at all
-        final_output = [{"sections": [], "master_section_index": -1}]
+def save_signal_index(index: SignalIndex, unwritten_timeframes: Iterable[str] = ()):
+    """
+    Persists the index next to the reports; call after writing them so the stamps match. Timeframes whose
+    report could not be written get a stamp no file can match, so the next load rebuilds the index from the
+    reports instead of trusting ids that never reached them.
+    """
+    report_stamps = _report_stamps()
+    for timeframe in unwritten_timeframes:
+        report_stamps[timeframe] = [-1, -1]
+    try:
+        index.save(SIGNAL_INDEX_FILENAME, report_stamps)
+    except OSError as e:
+        logging.error(f"Error saving signal index to {SIGNAL_INDEX_FILENAME}: {e}")
+
+
+@timed_stage('report_load')
+def load_existing_signals() -> Tuple[SignalIndex, ReportRecords]:
+    """
+    Loads the ids of all previously reported signals.
+
+    Returns:
+        A tuple containing:
+        - A SignalIndex of unique signal identifiers for fast checking, read from SIGNAL_INDEX_FILENAME when
+          it matches the reports, otherwise rebuilt from the reports and saved.
+        - A ReportRecords mapping that loads a timeframe's SignalRecords only when its report is regenerated.
+    """
+    logging.info("Loading existing signals from previous runs...")
+    report_stamps = _report_stamps()
+    index = SignalIndex.load(SIGNAL_INDEX_FILENAME, report_stamps)
+    if index is None:
+        logging.info("Signal index missing or out of date; rebuilding it from the reports...")
+        index = SignalIndex(timeframes=TIMEFRAMES)
+        for timeframe in TIMEFRAMES:
+            for signal in read_report_sections(timeframe):
+                # Get script-compatible timeframe name for the unique ID
+                gui_tf = signal.get('timeframe_name', '')
+                script_tf = _SCRIPT_TF_BY_GUI_NAME.get(gui_tf, gui_tf)
+                # Create a unique identifier for the signal
+                signal_id = (signal.get('symbol'), script_tf, signal.get('entry_date'))
+                if all(signal_id):  # Ensure no None values
+                    index.add(signal_id)
         try:
-            with open(filename, 'w') as f:
-                json.dump(final_output, f, indent=4)
-            logging.info(f"Successfully saved empty report to {filename}")
-        except Exception as e:
-            logging.error(f"Error saving empty JSON report to {filename}: {e}")
-        return
+            index.save(SIGNAL_INDEX_FILENAME, report_stamps)
+        except OSError as e:
+            logging.error(f"Error saving signal index to {SIGNAL_INDEX_FILENAME}: {e}")
+
+    logging.info(f"Loaded {len(index)} unique signals from previous runs.")
+    return index, ReportRecords()
+
 
-    sections = []
-    # --- MODIFIED: Use the helper function as the key for sorting ---
-    sorted_signals = sorted(signals_list, key=get_sort_key)
+def _fmt_report_value(v, p=4):
+    return f"{v:.{p}f}" if isinstance(v, (int, float)) and pd.notna(v) else ""
 
-    for row in sorted_signals:
+
+def _to_float_if_possible(v):
+    # Convert numeric strings from old format back to float for formatting
+    try:
+        return float(v)
+    except (ValueError, TypeError):
+        return v
+
+
+REPORT_DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def _entry_date_to_ms(entry_date: str) -> int:
+    """Epoch ms of a 'YYYY-MM-DD HH:MM' UTC string; sliced by hand as strptime dominates report loading."""
+    if entry_date[4] != '-' or entry_date[7] != '-' or entry_date[10] != ' ' or entry_date[13] != ':':
+        raise ValueError(f"Unexpected entry_date format: {entry_date!r}")
+    return calendar.timegm((int(entry_date[0:4]), int(entry_date[5:7]), int(entry_date[8:10]),
+                            int(entry_date[11:13]), int(entry_date[14:16]), 0)) * 1000
+
+
+# Reverse map to convert GUI timeframe names back to script-compatible names
+_SCRIPT_TF_BY_GUI_NAME = {v: k for k, v in _temp_map_tf_for_gui_slots.items()}
+
+
+class SignalRecord:
+    """
+    Canonical report row with its entry time as epoch milliseconds.
+
+    Built once per signal (new scanner dicts and old report sections alike), after which sorting and
+    writing reports need no datetime parsing or format reconciliation.
+    """
+
+    __slots__ = ('symbol', 'timeframe_name', 'direction', 'entry', 'resistance', 'stoploss', 'entry_date',
+                 'entry_ms')
+
+    def __init__(self, symbol: str, timeframe_name: str, direction: str, entry: str, resistance: str,
+                 stoploss: str, entry_date: str, entry_ms: int):
+        self.symbol = symbol
+        self.timeframe_name = timeframe_name
+        self.direction = direction
+        self.entry = entry
+        self.resistance = resistance
+        self.stoploss = stoploss
+        self.entry_date = entry_date
+        self.entry_ms = entry_ms
+
+    @classmethod
+    def from_signal(cls, row: Dict) -> 'SignalRecord':
+        """Converts a signal dict (new scanner format or an old report section) into a record."""
         # Handle both new dict format and old JSON format
-        symbol = row.get('symbol')
         # The 'timeframe' key might not exist in old signals, so we derive it
         gui_tf_name = row.get('timeframe_name', '')
-        # Reverse lookup to get script timeframe
-        script_tf_map = {v: k for k, v in _temp_map_tf_for_gui_slots.items()}
-        timeframe = row.get('timeframe') or script_tf_map.get(gui_tf_name, gui_tf_name)
+        timeframe = row.get('timeframe') or _SCRIPT_TF_BY_GUI_NAME.get(gui_tf_name, gui_tf_name)
 
-        # Get the alert_time using the same logic as the sort key
-        alert_time = get_sort_key(row)
+        alert_time = row.get('alert_time', row.get('entry_date'))
+        entry_ms = None
+        if isinstance(alert_time, str) and len(alert_time) == 16:
+            # Already in report format: a strict parse is all that is needed for the epoch value.
+            try:
+                entry_date, entry_ms = alert_time, _entry_date_to_ms(alert_time)
+            except ValueError:
+                pass
+        if entry_ms is None:
+            # Convert the string to a datetime object AND make it timezone-aware (UTC)
+            alert_time = pd.to_datetime(alert_time, utc=True) if isinstance(alert_time, str) else alert_time
+            entry_date = alert_time.strftime(REPORT_DATE_FORMAT)
+            entry_ms = pd.Timestamp(alert_time).value // 1_000_000
 
         signal_type = row.get('type')
         # 'direction' exists in old signals, 'type' in new ones. Need to reconcile.
         if not signal_type:
             signal_type = "Green" if row.get('direction') == "Short" else "Red"
 
-        alert_close = row.get('alert_candle_close') or row.get('entry')
-        resistance = row.get('json_resistance_val') or row.get('resistance')
-        stoploss = row.get('json_stoploss_val') or row.get('stoploss')
+        alert_close = _to_float_if_possible(row.get('alert_candle_close') or row.get('entry'))
+        resistance = _to_float_if_possible(row.get('json_resistance_val') or row.get('resistance'))
+        stoploss = _to_float_if_possible(row.get('json_stoploss_val') or row.get('stoploss'))
 
-        # Convert numeric strings from old format back to float for formatting
-        try:
-            alert_close = float(alert_close)
-        except (ValueError, TypeError):
-            pass
-        try:
-            resistance = float(resistance)
-        except (ValueError, TypeError):
-            pass
-        try:
-            stoploss = float(stoploss)
-        except (ValueError, TypeError):
-            pass
+        return cls(row.get('symbol'), _temp_map_tf_for_gui_slots.get(timeframe, timeframe),
+                   "Short" if signal_type == 'Green' else "Long", _fmt_report_value(alert_close),
+                   _fmt_report_value(resistance), _fmt_report_value(stoploss), entry_date, entry_ms)
 
-        gui_tf = map_tf_to_gui_name(timeframe)
-        direction = "Short" if signal_type == 'Green' else "Long"
+    @property
+    def timeframe(self) -> str:
+        return _SCRIPT_TF_BY_GUI_NAME.get(self.timeframe_name, self.timeframe_name)
 
-        signal_dict = {
-            "type": "section", "timeframe_name": gui_tf, "color_state_index": 3, "is_closed": False,
-            "direction": direction, "entry": fmt_val(alert_close),
-            "resistance": fmt_val(resistance),
-            "stoploss": fmt_val(stoploss), "target": "", "candle_num": "",
-            "entry_date": alert_time.strftime('%Y-%m-%d %H:%M'), "symbol": symbol
+    def to_section(self) -> Dict:
+        return {
+            "type": "section", "timeframe_name": self.timeframe_name, "color_state_index": 3, "is_closed": False,
+            "direction": self.direction, "entry": self.entry,
+            "resistance": self.resistance,
+            "stoploss": self.stoploss, "target": "", "candle_num": "",
+            "entry_date": self.entry_date, "symbol": self.symbol
         }
-        sections.append(signal_dict)
 
+
+def format_signal_section(row: Dict) -> Dict:
+    """Converts a signal dict (new scanner format or an old report section) into a report section."""
+    return SignalRecord.from_signal(row).to_section()
+
+
+def merge_sorted_records(records: List[SignalRecord]) -> List[SignalRecord]:
+    """
+    Orders records by entry time exactly like a stable sort would, in linear time for the usual case of
+    an already-sorted history followed by a few new records: the longest sorted prefix is merged with
+    the sorted remainder.
+    """
+    prefix_end = 1
+    while prefix_end < len(records) and records[prefix_end - 1].entry_ms <= records[prefix_end].entry_ms:
+        prefix_end += 1
+    if prefix_end >= len(records):
+        return list(records)
+    remainder = sorted(records[prefix_end:], key=lambda record: record.entry_ms)
+    return list(heapq.merge(records[:prefix_end], remainder, key=lambda record: record.entry_ms))
+
+
+@timed_stage('report_write')
+def write_report_sections(sections: List[Dict], filename: str) -> bool:
+    """Writes the report and returns whether it was saved; failures are logged, not raised."""
+    STAGE_STATS.add(rows=len(sections))
     master_idx = 0 if sections else -1
     final_output = [{"sections": sections, "master_section_index": master_idx}]
     try:
         with open(filename, 'w') as f:
             json.dump(final_output, f, indent=4)
-        logging.info(f"Successfully saved updated report to {filename}")
+        logging.info(f"Successfully saved {'updated' if sections else 'empty'} report to {filename}")
+        return True
     except Exception as e:
         logging.error(f"Error saving JSON report to {filename}: {e}")
+        return False
 
-# --- Main Execution Logic ---
-def run_analysis_loop():
-    # --- MODIFIED: Load previously reported signals to create a "memory" ---
-    previously_reported_signals_set, existing_signals_by_tf = load_existing_signals()
 
-    # This dictionary will only hold NEW signals found in this run
-    new_signals_by_timeframe = {tf: [] for tf in TIMEFRAMES}
-    total_new_signals_found = 0
+def generate_timeframe_json_report(signals_list: List, filename: str) -> bool:
+    # This function now takes a list of SignalRecords and/or signal dictionaries directly
+    records = [row if isinstance(row, SignalRecord) else SignalRecord.from_signal(row) for row in signals_list]
+    return write_report_sections([record.to_section() for record in merge_sorted_records(records)], filename)
 
-    for symbol in SYMBOLS:
-        for timeframe in TIMEFRAMES:
-            analysis_candle_count = ANALYSIS_CANDLE_COUNTS.get(timeframe, DEFAULT_ANALYSIS_CANDLE_COUNT)
-            logging.info(f"--- Processing {symbol} on {timeframe} timeframe ({analysis_candle_count} candles) ---")
 
-            total_candles_to_fetch = analysis_candle_count + MIN_CANDLES_FOR_INDICATORS
-            df_raw = BinanceAPI.fetch_recent_klines(symbol, timeframe, total_candles_to_fetch)
-            if df_raw is None or len(df_raw) < total_candles_to_fetch:
-                logging.warning(f"Could not fetch enough data for {symbol}/{timeframe}. Skipping.")
-                continue
+class SignalStore:
+    """
+    Append-only SQLite log of reported signals, unique on (symbol, timeframe, entry_date).
+
+    This is the source of truth for dedup; the signals_report_*.json files are exports of it. Rows hold
+    the report section exactly as first written, so exporting needs no re-parsing. On first use the
+    existing JSON reports are imported once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS signals (symbol TEXT NOT NULL, timeframe TEXT NOT NULL, "
+                "entry_date TEXT NOT NULL, entry_ms INTEGER NOT NULL, section TEXT NOT NULL, "
+                "UNIQUE (symbol, timeframe, entry_date))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS signals_by_time ON signals (timeframe, entry_ms)")
+            self._conn.commit()
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                self._import_json_reports()
+        return self._conn
 
-            df_processed = calculate_indicators(df_raw)
-            if df_processed is None or df_processed.empty:
-                logging.warning(f"Could not calculate indicators for {symbol}/{timeframe}. Skipping.")
+    def _insert_sections(self, timeframe_sections: List[Tuple[str, Dict]]) -> List[bool]:
+        """Inserts (timeframe, section) rows, returning for each whether it was new. Caller commits."""
+        inserted = []
+        for timeframe, section in timeframe_sections:
+            cursor = self._conn.execute("INSERT OR IGNORE INTO signals VALUES (?, ?, ?, ?, ?)",
+                                        (section['symbol'], timeframe, section['entry_date'],
+                                         _entry_date_to_ms(section['entry_date']), json.dumps(section)))
+            inserted.append(cursor.rowcount == 1)
+        return inserted
+
+    def _import_json_reports(self):
+        logging.info("Importing existing JSON reports into the signal store...")
+        imported = 0
+        for timeframe in TIMEFRAMES:
+            filename = f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
+            if not os.path.exists(filename): continue
+            try:
+                with open(filename, 'r') as f:
+                    data = json.load(f)
+                sections = data[0]['sections'] if data and isinstance(data, list) and 'sections' in data[0] else []
+            except (json.JSONDecodeError, IOError, IndexError) as e:
+                logging.warning(f"Could not read or parse existing report {filename}. Skipping import. Error: {e}")
                 continue
+            sections = [section for section in sections if section.get('symbol') and section.get('entry_date')
+                        and _SCRIPT_TF_BY_GUI_NAME.get(section.get('timeframe_name'), timeframe) == timeframe]
+            imported += sum(self._insert_sections([(timeframe, section) for section in sections]))
+        self._conn.execute("PRAGMA user_version = 1")
+        self._conn.commit()
+        logging.info(f"Imported {imported} signals from JSON reports.")
+
+    @timed_stage('signal_store')
+    def add_signals(self, signals: List[Dict]) -> List[Dict]:
+        """Appends the signals not stored yet and returns them, in input order."""
+        if not signals: return []
+        STAGE_STATS.add(rows=len(signals))
+        sections = [format_signal_section(signal) for signal in signals]
+        new_signals = []
+        with self._lock:
+            self._connect()
+            inserted_flags = self._insert_sections([(signal['timeframe'], section)
+                                                    for signal, section in zip(signals, sections)])
+            for signal, section, inserted in zip(signals, sections, inserted_flags):
+                if inserted:
+                    logging.info(f"★★★★★ NEW SIGNAL FOUND ★★★★★ [{signal['symbol']}/{signal['timeframe']}] "
+                                 f"on {section['entry_date']}")
+                    new_signals.append(signal)
+            self._conn.commit()
+        return new_signals
+
+    def sections(self, timeframe: str, since_ms: Optional[int] = None, limit: Optional[int] = None,
+                 offset: int = 0) -> List[Dict]:
+        """Report sections of one timeframe in report order, optionally windowed and paginated."""
+        query = "SELECT section FROM signals WHERE timeframe = ? AND entry_ms >= ? ORDER BY entry_ms, rowid"
+        params = [timeframe, since_ms if since_ms is not None else -2 ** 62]
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [json.loads(section) for section, in rows]
+
+
+SIGNAL_STORE: Optional[SignalStore] = SignalStore(SIGNAL_DB_FILENAME)
+
+
+def export_timeframe_report(timeframe: str, filename: Optional[str] = None) -> bool:
+    """Writes signals_report_<timeframe>.json from the signal store, limited to REPORT_WINDOW_DAYS if set."""
+    filename = filename or f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
+    since_ms = None
+    if REPORT_WINDOW_DAYS is not None:
+        since_ms = int((time.time() - REPORT_WINDOW_DAYS * 86_400) * 1000)
+    return write_report_sections(SIGNAL_STORE.sections(timeframe, since_ms=since_ms), filename)
+
+
+def advance_series(symbol: str, timeframe: str, df_closed: pd.DataFrame, analysis_candle_count: int,
+                   state: Optional[IndicatorState]) -> Tuple[Optional[IndicatorState], List[Dict]]:
+    """
+    Brings `state` up to the last candle of df_closed and returns it with the signals found on the way.
+
+    When there is no state, or it no longer overlaps df_closed, a fresh one is seeded from a batch
+    pass over the last analysis_candle_count candles. Returns (None, []) if there is not enough data.
+    """
+    if state is not None and state.last_open_time in df_closed.index:
+        return state, state.advance(symbol, timeframe, df_closed[df_closed.index > state.last_open_time])
+
+    df_processed = calculate_indicators(df_closed)
+    if df_processed is None or df_processed.empty:
+        logging.warning(f"Could not calculate indicators for {symbol}/{timeframe}. Skipping.")
+        return None, []
+
+    analysis_df = df_processed.tail(analysis_candle_count).copy()
+    active_green_setup = {'active': False}
+    active_red_setup = {'active': False}
+    signals = scan_setups_for_series(symbol, timeframe, analysis_df, active_green_setup, active_red_setup)
+    return IndicatorState.from_indicator_frame(analysis_df, active_green_setup, active_red_setup), signals
+
+
+def analyze_series(symbol: str, timeframe: str, df_raw: pd.DataFrame, analysis_candle_count: int) -> List[Dict]:
+    """
+    Runs indicators and the setup state machine over one fetched series and returns its signals.
+
+    When an IndicatorState from a previous run is stored and still overlaps the series, only the
+    candles closed since then are processed. The still-open candle is evaluated on a throwaway copy
+    of the state so it is re-evaluated once it closes.
+    """
+    with STAGE_STATS.stage('analysis', symbol, timeframe) as stage:
+        stage['rows'] = len(df_raw)
+        df_closed, df_open = split_closed_candles(df_raw, timeframe)
+        state = CANDLE_STORE.load_indicator_state(symbol, timeframe) if CANDLE_STORE is not None else None
+        state, signals = advance_series(symbol, timeframe, df_closed, analysis_candle_count, state)
+        if state is None: return signals
+
+        if CANDLE_STORE is not None:
+            CANDLE_STORE.save_indicator_state(symbol, timeframe, state)
+        return signals + copy.deepcopy(state).advance(symbol, timeframe, df_open)
+
+
+def _init_analysis_worker(candle_cache_path: Optional[str]):
+    """Gives each worker process its own candle store connection (sqlite connections do not survive fork)."""
+    global CANDLE_STORE
+    CANDLE_STORE = CandleStore(candle_cache_path) if candle_cache_path else None
+    STAGE_STATS.reset()  # A forked worker starts with a copy of the parent's counters.
+
+
+def _analyze_shared_series(job: Tuple[str, int, int, int, str, str, int, Optional[int]]
+                           ) -> Tuple[List[Dict], Dict]:
+    """
+    Worker side of analyze_all_series: rebuilds one series from the shared block and analyses it.
+    Returns the signals with the stage stats recorded for it, which the parent merges.
+    """
+    shm_name, total_rows, start, length, symbol, timeframe, analysis_candle_count, fetched_at_ms = job
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        open_times = np.ndarray((total_rows,), dtype='int64', buffer=shm.buf)
+        values = np.ndarray((len(SHARED_CANDLE_COLUMNS), total_rows), dtype='float64', buffer=shm.buf,
+                            offset=total_rows * 8)
+        index = pd.to_datetime(open_times[start:start + length], unit='ms', utc=True).rename('open_time')
+        df_raw = pd.DataFrame({col: values[i, start:start + length].copy() for i, col in
+                               enumerate(SHARED_CANDLE_COLUMNS)}, index=index)
+        if fetched_at_ms is not None:
+            df_raw.attrs[FETCHED_AT_ATTR] = fetched_at_ms
+        del open_times, values
+    finally:
+        shm.close()
+    try:
+        signals = analyze_series(symbol, timeframe, df_raw, analysis_candle_count)
+    except Exception as e:
+        logging.error(f"[{symbol}/{timeframe}] Analysis failed in worker: {e}", exc_info=True)
+        signals = []
+    return signals, STAGE_STATS.drain()
 
-            analysis_df = df_processed.tail(analysis_candle_count).copy()
-            active_green_setup = {'active': False}
-            active_red_setup = {'active': False}
 
-            for i in range(1, len(analysis_df)):
-                signals_this_candle = check_and_update_setups_for_candle(symbol, timeframe, analysis_df, i,
-                                                                         active_green_setup, active_red_setup)
+def analyze_all_series(series: List[Tuple[str, str, pd.DataFrame, int]], workers: int = ANALYSIS_WORKERS
+                       ) -> List[List[Dict]]:
+    """
+    Runs analyze_series for each (symbol, timeframe, df_raw, analysis_candle_count) job and returns the
+    signal lists in job order, so the merged result does not depend on scheduling.
 
-                # --- MODIFIED: Check against memory before reporting a signal ---
-                for new_signal in signals_this_candle:
-                    # Create the unique identifier for this signal
-                    alert_time_str = new_signal['alert_time'].strftime('%Y-%m-%d %H:%M')
-                    signal_id = (new_signal['symbol'], new_signal['timeframe'], alert_time_str)
+    With workers > 1 the jobs are sharded over a process pool. The candles of all jobs are packed into
+    one shared-memory block (int64 open times followed by float64 OHLCV columns), so workers receive
+    offsets instead of pickled DataFrames.
+    """
+    if workers <= 1 or len(series) <= 1:
+        return [analyze_series(*job) for job in series]
 
-                    if signal_id not in previously_reported_signals_set:
-                        logging.info(f"★★★★★ NEW SIGNAL FOUND ★★★★★ [{symbol}/{timeframe}] on {alert_time_str}")
-                        new_signals_by_timeframe[timeframe].append(new_signal)
-                        # Add to set to avoid duplicates within the same run
-                        previously_reported_signals_set.add(signal_id)
-                        total_new_signals_found += 1
+    total_rows = sum(len(df_raw) for _, _, df_raw, _ in series)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total_rows * 8 * (1 + len(SHARED_CANDLE_COLUMNS))))
+    try:
+        open_times = np.ndarray((total_rows,), dtype='int64', buffer=shm.buf)
+        values = np.ndarray((len(SHARED_CANDLE_COLUMNS), total_rows), dtype='float64', buffer=shm.buf,
+                            offset=total_rows * 8)
+        jobs, start = [], 0
+        for symbol, timeframe, df_raw, analysis_candle_count in series:
+            length = len(df_raw)
+            open_times[start:start + length] = df_raw.index.as_unit('ns').asi8 // 1_000_000
+            for i, col in enumerate(SHARED_CANDLE_COLUMNS):
+                values[i, start:start + length] = df_raw[col].to_numpy(dtype='float64')
+            jobs.append((shm.name, total_rows, start, length, symbol, timeframe, analysis_candle_count,
+                         df_raw.attrs.get(FETCHED_AT_ATTR)))
+            start += length
+        del open_times, values
 
-            time.sleep(0.5)
+        candle_cache_path = CANDLE_STORE.path if CANDLE_STORE is not None else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_analysis_worker,
+                                 initargs=(candle_cache_path,)) as pool:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            results = []
+            for signals, stage_stats in pool.map(_analyze_shared_series, jobs, chunksize=chunksize):
+                STAGE_STATS.merge(stage_stats)
+                results.append(signals)
+            return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def filter_new_signals(signals: List[Dict], reported_signals_set: 'SignalIndex') -> List[Dict]:
+    """Drops signals already in reported_signals_set and adds the remaining ones to it."""
+    new_signals = []
+    for new_signal in signals:
+        # Create the unique identifier for this signal
+        alert_time_str = new_signal['alert_time'].strftime('%Y-%m-%d %H:%M')
+        signal_id = (new_signal['symbol'], new_signal['timeframe'], alert_time_str)
+
+        if signal_id not in reported_signals_set:
+            logging.info(f"★★★★★ NEW SIGNAL FOUND ★★★★★ [{new_signal['symbol']}/{new_signal['timeframe']}] "
+                         f"on {alert_time_str}")
+            new_signals.append(new_signal)
+            # Add to set to avoid duplicates within the same run
+            reported_signals_set.add(signal_id)
+    return new_signals
+
+
+# --- Main Execution Logic ---
+def run_analysis_loop(workers: int = ANALYSIS_WORKERS, export_reports: bool = True,
+                      due: Optional[Set[Tuple[str, str]]] = None) -> Tuple[Dict[Tuple[str, str], int], int]:
+    """
+    One sweep over SYMBOLS x TIMEFRAMES, or only over the (symbol, timeframe) series in `due`.
+
+    Returns the open time (ms) of the last closed candle seen per series, including series fetched but too
+    short to analyse (only failed fetches are left out, so the scheduler retries just those), and the
+    number of new signals.
+    """
+    if SIGNAL_STORE is None:
+        # --- MODIFIED: Load previously reported signals to create a "memory" ---
+        previously_reported_signals_set, existing_signals_by_tf = load_existing_signals()
+
+    # This dictionary will only hold NEW signals found in this run
+    new_signals_by_timeframe = {tf: [] for tf in TIMEFRAMES}
+    total_new_signals_found = 0
+
+    # Planned for every timeframe even when only some are due, so the cached BASE_INTERVAL series keeps
+    # the length the derived timeframes need.
+    jobs, needed_candles = plan_fetch_jobs(SYMBOLS, TIMEFRAMES)
+    if due is not None:
+        intervals = {(symbol, BASE_INTERVAL if timeframe in DERIVED_TIMEFRAMES else timeframe)
+                     for symbol, timeframe in due}
+        jobs = [job for job in jobs if (job[0], job[1]) in intervals]
+    fetched = fetch_klines_concurrently(jobs)
+    REQUEST_STATS.log_summary()
+    series, too_short = assemble_series(SYMBOLS, TIMEFRAMES, fetched, needed_candles, only=due)
+    last_closed_ms = {}
+    for symbol, timeframe, df_raw in [job[:3] for job in series] + too_short:
+        df_closed, _ = split_closed_candles(df_raw, timeframe)
+        if not df_closed.empty:
+            last_closed_ms[(symbol, timeframe)] = int(df_closed.index[-1].value // 1_000_000)
+        elif df_raw.attrs.get(FETCHED_AT_ATTR) is not None:
+            # Too young to have a closed candle yet: nothing to retry until the next one closes.
+            fetched_at_ms = df_raw.attrs[FETCHED_AT_ATTR]
+            last_closed_ms[(symbol, timeframe)] = (fetched_at_ms - fetched_at_ms % INTERVAL_MS[timeframe]
+                                                   - INTERVAL_MS[timeframe])
+
+    logging.info(f"--- Analysing {len(series)} series with {max(1, workers)} worker(s) ---")
+    # Results come back in SYMBOLS x TIMEFRAMES order so report ordering stays deterministic.
+    for (symbol, timeframe, _, _), signals in zip(series, analyze_all_series(series, workers)):
+        if SIGNAL_STORE is not None:
+            new_signals = SIGNAL_STORE.add_signals(signals)
+        else:
+            new_signals = filter_new_signals(signals, previously_reported_signals_set)
+        new_signals_by_timeframe[timeframe].extend(new_signals)
+        total_new_signals_found += len(new_signals)
 
     logging.info("\n--- Analysis Complete ---")
     if total_new_signals_found == 0:
-        logging.info("No new signals found in this run. Reports will be re-saved with existing data.")
+        logging.info("No new signals found in this run.")
     else:
         logging.info(f"Found a total of {total_new_signals_found} new signals. Updating reports...")
 
+    if SIGNAL_STORE is not None:
+        # Only timeframes with new signals (or no report yet) need exporting; the store already has them.
+        for timeframe in TIMEFRAMES:
+            filename = f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
+            if export_reports and (new_signals_by_timeframe[timeframe] or not os.path.exists(filename)):
+                export_timeframe_report(timeframe, filename)
+        return last_closed_ms, total_new_signals_found
+
     # --- MODIFIED: Combine old and new signals before saving the final reports ---
+    # Only timeframes with new signals (or no report yet) are rewritten, so old reports are parsed lazily.
+    unwritten_timeframes = []
     for timeframe in TIMEFRAMES:
-        old_signals_list = existing_signals_by_tf.get(timeframe, [])
-        new_signals_list = new_signals_by_timeframe.get(timeframe, [])
-        combined_signals = old_signals_list + new_signals_list
-
         filename = f"{JSON_FILENAME_PREFIX}_{timeframe}.json"
+        if not new_signals_by_timeframe[timeframe] and os.path.exists(filename): continue
+        combined_signals = existing_signals_by_tf[timeframe] + new_signals_by_timeframe[timeframe]
+        if not generate_timeframe_json_report(combined_signals, filename):
+            unwritten_timeframes.append(timeframe)
+    save_signal_index(previously_reported_signals_set, unwritten_timeframes)
+    return last_closed_ms, total_new_signals_found
+
+
+# --- Scheduler Mode ---
+class SweepScheduler:
+    """
+    Daemon that replaces repeated full runs: it remembers the last closed candle analysed per
+    (symbol, timeframe), sleeps until the next interval boundary and sweeps only the series that
+    have closed a candle since. Klines are aligned to the epoch, so every wake is on a 5m boundary
+    and the higher timeframes join the sweep when their own boundary coincides.
+    """
+
+    def __init__(self, timeframes: List[str], workers: int = ANALYSIS_WORKERS, export_reports: bool = True,
+                 after_sweep: Optional[str] = None):
+        self.timeframes = timeframes
+        self.workers = workers
+        self.export_reports = export_reports
+        self.after_sweep = after_sweep
+        self.last_processed: Dict[Tuple[str, str], int] = {}
+        self.started = time.perf_counter()
+
+    @staticmethod
+    def last_closed_open_ms(timeframe: str, now_ms: int) -> int:
+        step = INTERVAL_MS[timeframe]
+        return now_ms - now_ms % step - step
+
+    def due_series(self, now_ms: int) -> Set[Tuple[str, str]]:
+        return {(symbol, timeframe) for symbol in SYMBOLS for timeframe in self.timeframes
+                if self.last_processed.get((symbol, timeframe), -1) < self.last_closed_open_ms(timeframe, now_ms)}
+
+    def seconds_until_next_close(self, now_ms: int) -> float:
+        next_close_ms = min(now_ms - now_ms % INTERVAL_MS[tf] + INTERVAL_MS[tf] for tf in self.timeframes)
+        return (next_close_ms - now_ms) / 1000 + SCHEDULER_CLOSE_DELAY_SECONDS
+
+    def refresh_symbols(self):
+        global SYMBOLS
+        symbols = get_top_volume_usdt_pairs(limit=TOP_SYMBOLS_LIMIT)
+        if not symbols:
+            logging.warning("Could not refresh the top symbols; keeping the current list.")
+            return
+        if set(symbols) != set(SYMBOLS):
+            logging.info(f"Symbol list changed: +{sorted(set(symbols) - set(SYMBOLS))} "
+                         f"-{sorted(set(SYMBOLS) - set(symbols))}")
+        SYMBOLS = symbols
+
+    def sweep(self, due: Set[Tuple[str, str]]):
+        skipped = len(SYMBOLS) * len(self.timeframes) - len(due)
+        logging.info(f"--- Scheduled sweep of {len(due)} series with new closed candles ({skipped} up to date) ---")
+        processed, num_new_signals = run_analysis_loop(self.workers, self.export_reports, due=due)
+        self.last_processed.update(processed)
+        write_run_summary('daemon', time.perf_counter() - self.started)
+        if num_new_signals and self.after_sweep:
+            logging.info(f"Running after-sweep command: {self.after_sweep}")
+            result = subprocess.run(self.after_sweep, shell=True)
+            if result.returncode != 0:
+                logging.error(f"After-sweep command exited with {result.returncode}")
+
+    def run(self):
+        retries = 0
+        ranked_day_ms = self.last_closed_open_ms('1d', int(time.time() * 1000))
+        while True:
+            now_ms = int(time.time() * 1000)
+            if self.last_closed_open_ms('1d', now_ms) > ranked_day_ms:
+                # The volume ranking is refreshed once a day, at the daily close.
+                ranked_day_ms = self.last_closed_open_ms('1d', now_ms)
+                self.refresh_symbols()
+            due = self.due_series(now_ms)
+            if due:
+                self.sweep(due)
+            now_ms = int(time.time() * 1000)
+            wait = self.seconds_until_next_close(now_ms)
+            # Series whose closed candle Binance had not served yet (or whose fetch failed) are
+            # retried a few times before waiting for the next boundary.
+            if self.due_series(now_ms) and retries < SCHEDULER_MAX_RETRIES:
+                retries += 1
+                wait = min(wait, SCHEDULER_RETRY_SECONDS)
+            else:
+                retries = 0
+            logging.info(f"Sleeping {wait:.0f}s until the next candle close.")
+            time.sleep(wait)
+
+
+# --- Run Reporting ---
+def _prometheus_labels(**labels) -> str:
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def render_prometheus_metrics(summary: Dict) -> str:
+    """Renders a run summary in the Prometheus text exposition format (e.g. for a node_exporter textfile)."""
+    lines = []
+
+    def metric(name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict, float]]):
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+        lines.extend(f"{METRICS_PREFIX}_{name}{_prometheus_labels(**labels)} {value}" for labels, value in samples)
+
+    metric('run_duration_seconds', 'gauge', "Wall time of the last run.",
+           [({'mode': summary['mode']}, summary['wall_seconds'])])
+    for field, help_text in (('seconds', "Wall time spent in a stage, summed over threads and workers "
+                                         "(includes nested stages)."),
+                             ('calls', "Times a stage was entered."), ('rows', "Rows processed by a stage."),
+                             ('bytes', "Bytes downloaded within a stage.")):
+        metric(f'stage_{field}_total', 'counter', help_text,
+               [({'stage': stage}, totals[field]) for stage, totals in sorted(summary['stages'].items())])
+        metric(f'series_stage_{field}_total', 'counter', help_text + " Per series.",
+               [({'symbol': series.rsplit('/', 1)[0], 'timeframe': series.rsplit('/', 1)[1], 'stage': stage},
+                 totals[field])
+                for series, stages in sorted(summary['series'].items()) for stage, totals in sorted(stages.items())])
+    for field in ('requests', 'errors', 'retries', 'bytes'):
+        metric(f'http_{field}_total', 'counter', f"HTTP {field} per endpoint.",
+               [({'endpoint': endpoint}, stats[field]) for endpoint, stats in sorted(summary['http'].items())])
+    return "\n".join(lines) + "\n"
+
+
+def write_run_summary(mode: str, wall_seconds: float, profile: Optional[Dict] = None,
+                      json_path: str = RUN_SUMMARY_FILENAME, metrics_path: str = RUN_METRICS_FILENAME) -> Dict:
+    """Writes the stage and HTTP counters of this run as JSON and as Prometheus text."""
+    summary = {'mode': mode, 'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'wall_seconds': wall_seconds, **STAGE_STATS.snapshot(), 'http': REQUEST_STATS.snapshot()}
+    if profile is not None:
+        summary['profile'] = profile
+    STAGE_STATS.log_summary()
+    try:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=4)
+        with open(metrics_path, 'w') as f:
+            f.write(render_prometheus_metrics(summary))
+        logging.info(f"Run summary saved to {json_path} and {metrics_path}")
+    except OSError as e:
+        logging.error(f"Error saving run summary: {e}")
+    return summary
+
+
+def start_profiling() -> cProfile.Profile:
+    """Starts cProfile on the calling thread and tracemalloc for all threads (--profile)."""
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
 
-        # Generate report even if it's just to re-save old signals or create an empty file
-        generate_timeframe_json_report(combined_signals, filename)
+def stop_profiling(profiler: cProfile.Profile) -> Dict:
+    """
+    Stops profiling, saves the cProfile stats to PROFILE_STATS_FILENAME and returns the hottest functions
+    and allocation sites. Fetch threads and analysis worker processes are not covered by cProfile.
+    """
+    profiler.disable()
+    profiler.dump_stats(PROFILE_STATS_FILENAME)
+    snapshot = tracemalloc.take_snapshot()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = pstats.Stats(profiler)
+    hottest = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP_ENTRIES]
+    top_functions = [{'function': f"{os.path.basename(filename)}:{line}({name})", 'calls': calls,
+                      'self_seconds': self_seconds, 'cumulative_seconds': cumulative_seconds}
+                     for (filename, line, name), (_, calls, self_seconds, cumulative_seconds, _) in hottest]
+    top_allocations = [{'site': str(stat.traceback[0]), 'bytes': stat.size, 'blocks': stat.count}
+                       for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ENTRIES]]
+    for entry in top_functions[:10]:
+        logging.info(f"Profile: {entry['cumulative_seconds']:8.3f}s cumulative, {entry['calls']:>8} calls  "
+                     f"{entry['function']}")
+    logging.info(f"Profile: peak traced memory {peak_bytes / 2 ** 20:.1f} MiB; stats saved to {PROFILE_STATS_FILENAME}")
+    return {'stats_file': PROFILE_STATS_FILENAME, 'peak_traced_bytes': peak_bytes,
+            'top_functions': top_functions, 'top_allocations': top_allocations}
+
+
+# --- Backtest Mode ---
+def _sync_history_range(store: CandleStore, symbol: str, interval: str, start_ms: int,
+                        end_ms: Optional[int] = None) -> int:
+    """Pages forward from start_ms, saving each page, up to end_ms (exclusive) or the current candle."""
+    saved = 0
+    while end_ms is None or start_ms < end_ms:
+        params = {"symbol": symbol.upper(), "interval": interval, "startTime": start_ms,
+                  "limit": HISTORICAL_DATA_CHUNK_LIMIT}
+        if end_ms is not None:
+            params["endTime"] = end_ms - 1
+        klines_chunk = BinanceAPI._request_klines(params)
+        if klines_chunk is None: break
+        klines_in_range = klines_chunk[klines_chunk[:, 0] < end_ms] if end_ms is not None else klines_chunk
+        store.save(symbol, interval, BinanceAPI._klines_array_to_df(klines_in_range), keep=None)
+        saved += len(klines_in_range)
+        if len(klines_chunk) < HISTORICAL_DATA_CHUNK_LIMIT: break
+        start_ms = int(klines_chunk[-1, 0]) + 1
+    return saved
+
+
+def sync_candle_history(store: CandleStore, symbol: str, interval: str, start_ms: int) -> int:
+    """
+    Downloads the candles missing from `store` between start_ms and now, page by page: first any history
+    older than the first stored candle (a longer backtest than the last sync), then from the last one on.
+    """
+    first_open_ms, last_open_ms = store.first_open_ms(symbol, interval), store.last_open_ms(symbol, interval)
+    saved = 0
+    if first_open_ms is not None and start_ms < first_open_ms:
+        logging.info(f"[{symbol}/{interval}] Backfilling candle history from "
+                     f"{pd.Timestamp(start_ms, unit='ms', tz='UTC'):%Y-%m-%d %H:%M}...")
+        saved += _sync_history_range(store, symbol, interval, start_ms, end_ms=first_open_ms)
+    next_start_ms = max(start_ms, last_open_ms) if last_open_ms is not None else start_ms
+    logging.info(f"[{symbol}/{interval}] Syncing candle history from "
+                 f"{pd.Timestamp(next_start_ms, unit='ms', tz='UTC'):%Y-%m-%d %H:%M}...")
+    return saved + _sync_history_range(store, symbol, interval, next_start_ms)
+
+
+class SignalOutcomeTracker:
+    """
+    Follows each signal from the candle after its alert until the candle whose range reaches
+    json_stoploss_val ('stopped') or BACKTEST_MAX_HOLD_CANDLES have passed ('expired').
+
+    Green setups are reported as Short and Red as Long, so the favourable excursion is measured
+    downwards for Green and upwards for Red, up to the candle before the stop is hit. Only open
+    trades are kept between chunks.
+    """
+
+    def __init__(self, max_hold_candles: int = BACKTEST_MAX_HOLD_CANDLES):
+        self.max_hold_candles = max_hold_candles
+        self.open_trades: List[Dict] = []
+        self.outcomes: List[Dict] = []
+
+    def add(self, signals: List[Dict]):
+        for signal in signals:
+            entry, stoploss = float(signal['alert_candle_close']), float(signal['json_stoploss_val'])
+            self.open_trades.append({
+                'symbol': signal['symbol'], 'timeframe': signal['timeframe'], 'type': signal['type'],
+                'direction': "Short" if signal['type'] == 'Green' else "Long",
+                'alert_time': signal['alert_time'], 'entry': entry, 'stoploss': stoploss,
+                'risk': abs(stoploss - entry), 'mfe': 0.0, 'candles_held': 0})
+
+    def _resolve(self, trade: Dict, outcome: str, resolution_time: Optional[pd.Timestamp]):
+        trade['outcome'] = outcome
+        trade['mfe_r'] = trade['mfe'] / trade['risk'] if trade['risk'] > 0 else None
+        trade['hours_to_resolution'] = ((resolution_time - trade['alert_time']).total_seconds() / 3600
+                                        if resolution_time is not None else None)
+        trade['alert_time'] = trade['alert_time'].strftime(REPORT_DATE_FORMAT)
+        self.outcomes.append(trade)
+
+    def update(self, df_chunk: pd.DataFrame):
+        if not self.open_trades or df_chunk.empty: return
+        times = df_chunk.index
+        highs, lows = df_chunk['high'].to_numpy(), df_chunk['low'].to_numpy()
+        still_open = []
+        for trade in self.open_trades:
+            start = int(times.searchsorted(trade['alert_time'], side='right'))
+            end = min(len(df_chunk), start + self.max_hold_candles - trade['candles_held'])
+            if start >= end:
+                still_open.append(trade)
+                continue
+            if trade['direction'] == "Short":
+                stop_hit, favourable = highs[start:end] >= trade['stoploss'], trade['entry'] - lows[start:end]
+            else:
+                stop_hit, favourable = lows[start:end] <= trade['stoploss'], highs[start:end] - trade['entry']
+            hit_offset = int(np.argmax(stop_hit)) if stop_hit.any() else None
+            considered = favourable[:hit_offset] if hit_offset is not None else favourable
+            if len(considered):
+                trade['mfe'] = max(trade['mfe'], float(considered.max()))
+            if hit_offset is not None:
+                trade['candles_held'] += hit_offset + 1
+                self._resolve(trade, 'stopped', times[start + hit_offset])
+                continue
+            trade['candles_held'] += end - start
+            if trade['candles_held'] >= self.max_hold_candles:
+                self._resolve(trade, 'expired', times[end - 1])
+            else:
+                still_open.append(trade)
+        self.open_trades = still_open
+
+    def finish(self) -> List[Dict]:
+        for trade in self.open_trades:
+            self._resolve(trade, 'open', None)
+        self.open_trades = []
+        return self.outcomes
+
+
+def summarize_outcomes(outcomes: List[Dict]) -> Dict:
+    stopped = [o for o in outcomes if o['outcome'] == 'stopped']
+    mfe_r = [o['mfe_r'] for o in outcomes if o['mfe_r'] is not None]
+    return {
+        'signals': len(outcomes), 'stopped': len(stopped),
+        'expired': sum(1 for o in outcomes if o['outcome'] == 'expired'),
+        'open': sum(1 for o in outcomes if o['outcome'] == 'open'),
+        'stop_rate': len(stopped) / len(outcomes) if outcomes else None,
+        'mean_mfe_r': float(np.mean(mfe_r)) if mfe_r else None,
+        'median_mfe_r': float(np.median(mfe_r)) if mfe_r else None,
+        'median_candles_to_stop': float(np.median([o['candles_held'] for o in stopped])) if stopped else None,
+    }
+
+
+def backtest_series(store: CandleStore, symbol: str, timeframe: str, start_ms: int = 0,
+                    chunk_size: int = BACKTEST_CHUNK_CANDLES) -> Tuple[List[Dict], int]:
+    """
+    Streams the stored history of one series through IndicatorState chunk by chunk, so memory stays
+    bounded by chunk_size, and returns the signal outcomes and the number of candles processed.
+    """
+    state, tracker, num_candles = None, SignalOutcomeTracker(), 0
+    for df_chunk in store.iter_chunks(symbol, timeframe, chunk_size, start_ms=start_ms):
+        df_chunk, _ = split_closed_candles(df_chunk, timeframe)
+        if df_chunk.empty: continue
+        num_candles += len(df_chunk)
+        if state is None:
+            state, signals = advance_series(symbol, timeframe, df_chunk, len(df_chunk), None)
+            if state is None: return [], num_candles
+        else:
+            signals = state.advance(symbol, timeframe, df_chunk)
+        tracker.add(signals)
+        tracker.update(df_chunk)
+    return tracker.finish(), num_candles
+
+
+def run_backtest(symbols: List[str], timeframes: List[str], days: int, sync: bool = True,
+                 store: Optional[CandleStore] = None, report_filename: str = BACKTEST_REPORT_FILENAME) -> Dict:
+    """Backtests the last `days` days of every (symbol, timeframe) and writes a JSON report."""
+    store = store or CandleStore(CANDLE_HISTORY_FILENAME)
+    start_ms = int((time.time() - days * 86_400) * 1000)
+    report = {'days': days, 'max_hold_candles': BACKTEST_MAX_HOLD_CANDLES, 'series': {}, 'signals': []}
+    for symbol in symbols:
+        for timeframe in timeframes:
+            if sync:
+                sync_candle_history(store, symbol, timeframe, start_ms)
+            started = time.perf_counter()
+            outcomes, num_candles = backtest_series(store, symbol, timeframe, start_ms=start_ms)
+            seconds = time.perf_counter() - started
+            summary = summarize_outcomes(outcomes)
+            summary.update(candles=num_candles, seconds=seconds)
+            report['series'][f"{symbol}/{timeframe}"] = summary
+            report['signals'].extend(outcomes)
+            logging.info(f"[{symbol}/{timeframe}] Backtested {num_candles} candles in {seconds:.2f}s: "
+                         f"{summary['signals']} signals, stop rate {summary['stop_rate']}")
+    report['overall'] = summarize_outcomes(report['signals'])
+    with open(report_filename, 'w') as f:
+        json.dump(report, f, indent=4)
+    logging.info(f"Backtest report saved to {report_filename}")
+    return report
+
+
+# --- Live Streaming Mode ---
+class SignalStream:
+    """
+    Long-running scanner fed by Binance kline WebSocket streams.
+
+    SYMBOLS x TIMEFRAMES are split over a few multiplexed connections. Each connection backfills its
+    series over REST whenever it (re)connects, then advances the series' IndicatorState on every closed
+    candle and rewrites the affected report as soon as a new signal appears. A closed candle that does
+    not directly follow the state (missed while disconnected) triggers a REST backfill of that series.
+    """
+
+    def __init__(self, symbols: List[str], timeframes: List[str], ws_url: str = BINANCE_WS_URL):
+        self.symbols = symbols
+        self.timeframes = timeframes
+        self.ws_url = ws_url
+        self.states: Dict[Tuple[str, str], IndicatorState] = {}
+        if SIGNAL_STORE is None:
+            self.reported_signals_set, self.signals_by_tf = load_existing_signals()
+            # Timeframes whose last report write failed; they keep the saved index invalid until rewritten.
+            self.unwritten_timeframes: Set[str] = set()
+
+    @staticmethod
+    def _analysis_candle_count(timeframe: str) -> int:
+        return ANALYSIS_CANDLE_COUNTS.get(timeframe, DEFAULT_ANALYSIS_CANDLE_COUNT)
+
+    def stream_batches(self) -> List[List[Tuple[str, str]]]:
+        keys = [(symbol, timeframe) for symbol in self.symbols for timeframe in self.timeframes]
+        return [keys[i:i + STREAMS_PER_CONNECTION] for i in range(0, len(keys), STREAMS_PER_CONNECTION)]
+
+    def stream_url(self, keys: List[Tuple[str, str]]) -> str:
+        return f"{self.ws_url}?streams=" + "/".join(f"{symbol.lower()}@kline_{timeframe}" for symbol, timeframe in keys)
+
+    def publish(self, timeframe: str, signals: List[Dict]):
+        if SIGNAL_STORE is not None:
+            if SIGNAL_STORE.add_signals(signals):
+                export_timeframe_report(timeframe)
+            return
+        new_signals = filter_new_signals(signals, self.reported_signals_set)
+        if not new_signals: return
+        self.signals_by_tf[timeframe].extend(new_signals)
+        if generate_timeframe_json_report(self.signals_by_tf[timeframe], f"{JSON_FILENAME_PREFIX}_{timeframe}.json"):
+            self.unwritten_timeframes.discard(timeframe)
+        else:
+            self.unwritten_timeframes.add(timeframe)
+        save_signal_index(self.reported_signals_set, self.unwritten_timeframes)
+
+    def _save_state(self, symbol: str, timeframe: str, state: IndicatorState):
+        self.states[(symbol, timeframe)] = state
+        if CANDLE_STORE is not None:
+            CANDLE_STORE.save_indicator_state(symbol, timeframe, state)
+
+    async def backfill(self, keys: List[Tuple[str, str]]):
+        """Catches the given series up to their last closed candle over REST."""
+        jobs = [(symbol, timeframe, self._analysis_candle_count(timeframe) + MIN_CANDLES_FOR_INDICATORS)
+                for symbol, timeframe in keys]
+        fetched = await asyncio.get_running_loop().run_in_executor(None, fetch_klines_concurrently, jobs)
+        for symbol, timeframe in keys:
+            df_raw = fetched.get((symbol, timeframe))
+            if df_raw is None or df_raw.empty:
+                logging.warning(f"[{symbol}/{timeframe}] Backfill failed; waiting for the next closed candle.")
+                continue
+            df_closed, _ = split_closed_candles(df_raw, timeframe)
+            state = self.states.get((symbol, timeframe))
+            if state is None and CANDLE_STORE is not None:
+                state = CANDLE_STORE.load_indicator_state(symbol, timeframe)
+            state, signals = advance_series(symbol, timeframe, df_closed, self._analysis_candle_count(timeframe),
+                                            state)
+            if state is None: continue
+            self._save_state(symbol, timeframe, state)
+            self.publish(timeframe, signals)
+
+    async def on_kline(self, kline: Dict):
+        """Handles one kline payload (the 'k' object of a Binance kline event)."""
+        if not kline.get('x'): return
+        symbol, timeframe = kline['s'], kline['i']
+        state = self.states.get((symbol, timeframe))
+        open_time = pd.Timestamp(kline['t'], unit='ms', tz='UTC')
+        if state is None or open_time - state.last_open_time != pd.Timedelta(milliseconds=INTERVAL_MS[timeframe]):
+            if state is None or open_time > state.last_open_time:
+                await self.backfill([(symbol, timeframe)])
+            return
+
+        df_new = pd.DataFrame({col: [float(kline[key])] for col, key in
+                               (('open', 'o'), ('high', 'h'), ('low', 'l'), ('close', 'c'), ('volume', 'v'))},
+                              index=pd.DatetimeIndex([open_time], name='open_time'))
+        signals = state.advance(symbol, timeframe, df_new)
+        if CANDLE_STORE is not None:
+            CANDLE_STORE.save(symbol, timeframe, df_new, keep=candle_cache_keep(
+                timeframe, self._analysis_candle_count(timeframe) + MIN_CANDLES_FOR_INDICATORS))
+        self._save_state(symbol, timeframe, state)
+        self.publish(timeframe, signals)
+
+    async def run_connection(self, keys: List[Tuple[str, str]]):
+        import websockets  # Only needed for --stream.
+
+        url = self.stream_url(keys)
+        while True:
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    logging.info(f"Stream connected for {len(keys)} series; backfilling over REST...")
+                    await self.backfill(keys)
+                    async for message in ws:
+                        payload = json.loads(message)
+                        kline = payload.get('data', payload).get('k')
+                        if kline:
+                            await self.on_kline(kline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Stream connection error: {e}. Reconnecting in {WS_RECONNECT_DELAY}s...")
+            await asyncio.sleep(WS_RECONNECT_DELAY)
+
+    async def run(self):
+        await asyncio.gather(*(self.run_connection(keys) for keys in self.stream_batches()))
 
 
 if __name__ == "__main__":
-    SYMBOLS = get_top_volume_usdt_pairs(limit=50)
+    parser = argparse.ArgumentParser(description="Scan top Binance USDT pairs for Green/Red setup signals.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Run continuously on kline WebSocket streams instead of a single batch sweep.")
+    parser.add_argument('--no-reports', action='store_true',
+                        help="Only record signals in the signal store; skip exporting the JSON reports.")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and sweep only the series whose candles have closed, on each boundary.")
+    parser.add_argument('--after-sweep', metavar='COMMAND',
+                        help="With --daemon, shell command to run after a sweep found new signals (e.g. a git push).")
+    parser.add_argument('--backtest', type=int, metavar='DAYS',
+                        help="Backtest the signal rules over the last DAYS days of history instead of scanning.")
+    parser.add_argument('--symbols', nargs='+', help="Symbols to backtest (default: the top volume USDT pairs).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile the run with cProfile and tracemalloc and add the results to the run summary.")
+    parser.add_argument('--workers', type=int, default=ANALYSIS_WORKERS,
+                        help="Worker processes for the indicator and signal stage of a batch sweep.")
+    args = parser.parse_args()
+
+    SYMBOLS = args.symbols if args.backtest and args.symbols else get_top_volume_usdt_pairs(limit=TOP_SYMBOLS_LIMIT)
     if not SYMBOLS:
         logging.critical("Could not fetch top symbols from Binance. Exiting.")
         sys.exit(1)
@@ -439,9 +2345,24 @@ if __name__ == "__main__":
     logging.info("Analysis will be performed on a rolling window of recent candles for each timeframe.")
     logging.info(f"Starting analysis for {len(SYMBOLS)} symbols: {str(SYMBOLS)[:200]}...")
 
+    mode = 'backtest' if args.backtest else 'stream' if args.stream else 'daemon' if args.daemon else 'batch'
+    profiler = start_profiling() if args.profile else None
+    run_start = time.perf_counter()
     try:
-        run_analysis_loop()
+        if args.backtest:
+            run_backtest(SYMBOLS, TIMEFRAMES, args.backtest)
+        elif args.stream:
+            asyncio.run(SignalStream(SYMBOLS, TIMEFRAMES).run())
+        elif args.daemon:
+            SweepScheduler(TIMEFRAMES, workers=args.workers, export_reports=not args.no_reports,
+                           after_sweep=args.after_sweep).run()
+        else:
+            run_analysis_loop(workers=args.workers, export_reports=not args.no_reports)
+    except KeyboardInterrupt:
+        logging.info("Interrupted by user.")
     except Exception as e:
         logging.critical("--- Analysis CRASHED! ---", exc_info=True)
     finally:
+        write_run_summary(mode, time.perf_counter() - run_start,
+                          profile=stop_profiling(profiler) if profiler is not None else None)
         logging.info("--- Script Finished ---")